@@ -1,9 +1,30 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
-from datetime import datetime, timezone
+import ssl
+import asyncio
+import argparse
+import heapq
+import itertools
+import random
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from datetime import datetime, timezone, timedelta
 import time
 import os
-from typing import List, Dict, Optional
+import sys
+import platform
+import tracemalloc
+import queue
+import threading
+import signal
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from bisect import bisect_left, bisect_right
+from collections import deque
+from urllib.parse import urlsplit, urlencode
+from typing import List, Dict, Optional, Union, Iterable, Iterator, AsyncIterator, Tuple, Callable
+import numpy as np
 from colorama import init, Fore, Style
 
 # Initialize colorama
@@ -19,20 +40,95 @@ ENVIRONMENT  = 'practice'
 # --- UPDATED: Instruments set to Bitcoin and Gold ---
 INSTRUMENTS  = 'BTC_USD,XAU_USD'
 
+# --- 'ALL' (or --instruments ALL) expands to the FX and metals universe below ---
+FX_METALS_UNIVERSE = ('AUD_CAD,AUD_CHF,AUD_HKD,AUD_JPY,AUD_NZD,AUD_SGD,AUD_USD,CAD_CHF,CAD_HKD,CAD_JPY,CAD_SGD,CHF_HKD,CHF_JPY,CHF_ZAR,'
+                      'EUR_AUD,EUR_CAD,EUR_CHF,EUR_CZK,EUR_DKK,EUR_GBP,EUR_HKD,EUR_HUF,EUR_JPY,EUR_NOK,EUR_NZD,EUR_PLN,EUR_SEK,EUR_SGD,'
+                      'EUR_TRY,EUR_USD,EUR_ZAR,GBP_AUD,GBP_CAD,GBP_CHF,GBP_HKD,GBP_JPY,GBP_NZD,GBP_PLN,GBP_SGD,GBP_USD,GBP_ZAR,HKD_JPY,'
+                      'NZD_CAD,NZD_CHF,NZD_HKD,NZD_JPY,NZD_SGD,NZD_USD,SGD_CHF,SGD_JPY,TRY_JPY,USD_CAD,USD_CHF,USD_CNH,USD_CZK,USD_DKK,'
+                      'USD_HKD,USD_HUF,USD_JPY,USD_MXN,USD_NOK,USD_PLN,USD_SEK,USD_SGD,USD_THB,USD_TRY,USD_ZAR,ZAR_JPY,'
+                      'XAU_USD,XAU_AUD,XAU_CAD,XAU_CHF,XAU_EUR,XAU_GBP,XAU_HKD,XAU_JPY,XAU_NZD,XAU_SGD,XAU_XAG,'
+                      'XAG_USD,XAG_AUD,XAG_CAD,XAG_CHF,XAG_EUR,XAG_GBP,XAG_HKD,XAG_JPY,XAG_NZD,XAG_SGD,XPT_USD,XPD_USD')
+
+# --- Pip sizes: FX pairs use 0.0001 unless quoted in one of PIP_SIZE_BY_QUOTE; INSTRUMENT_PIPS pins
+# --- (pip size, USD value of one pip per unit) where that rule doesn't apply ---
+PIP_SIZE_BY_QUOTE = {'JPY': 0.01, 'HUF': 0.01, 'THB': 0.01, 'CZK': 0.001}
+INSTRUMENT_PIPS = {'BTC_USD': (1.0, 0.01), 'XAU_USD': (1.0, 0.01)}
+INSTRUMENT_PRICE_DECIMALS = {'XAU_USD': 3}  # Order prices otherwise carry one decimal more than the pip size
+
+# --- Sharded runtime: >0 routes ticks from one ingest process to this many worker processes ---
+SHARD_WORKERS = 0
+
 # --- Risk management remains at $5 per trade ---
 RISK_PER_TRADE_USD = 5.0
 
+# --- Positions: how many may be open per instrument (new setups are still analysed until the cap),
+# --- and optional partial take-profits as (fraction of the way to TP, fraction of units) pairs ---
+MAX_POSITIONS_PER_INSTRUMENT = 1
+PARTIAL_TAKE_PROFITS = ()  # e.g. ((0.5, 0.5),) banks half the units halfway to TP
+
+# --- Order execution: send opens/closes to the OANDA v3 REST API (off by default: trades stay in memory).
+# --- ORDER_WORKERS threads each keep one pre-warmed keep-alive connection, pinged when idle ---
+EXECUTE_ORDERS = False
+ORDER_WORKERS = 2
+ORDER_RETRIES = 3
+ORDER_RESUBMITS = 5  # Reconcile rounds for an order whose outcome stayed unknown after its retries
+ORDER_TIMEOUT_S = 5.0
+ORDER_KEEPALIVE_S = 15.0
+
+# --- Dashboard: redraw rate, or HEADLESS to skip rendering entirely ---
+DASHBOARD_FPS = 4.0
+HEADLESS = False
+
+# --- Pricing stream client: 'requests' (blocking) or 'asyncio' (coalescing, fast-path decode) ---
+STREAM_CLIENT = 'requests'
+
+# --- Warm start: preload this many recent H1/H4 candles, cached on disk between runs ---
+WARM_START = True
+WARM_START_CANDLES = 1000
+WARM_START_WORKERS = 8  # Concurrent candle requests, each on its own pooled connection
+CANDLE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'candle_cache')
+
+# --- State journal: closed candles, trades and POI mitigations survive restarts ---
+JOURNAL = True
+STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state')
+SNAPSHOT_INTERVAL_S = 300
+JOURNAL_FLUSH_INTERVAL_S = 0.2
+
+# --- Tick recorder: binary tick capture for later replay (see TickRecorder/TickReader) ---
+RECORD_TICKS = False
+TICK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ticks')
+TICK_FILE_RECORDS = 4_000_000  # 128 MB per file before rotating
+TICK_REORDER_S = 1.0  # Ticks within this much tick time of the newest wait a flush for stragglers, so files stay time-sorted
+
+# --- Candle timeframes aggregated from ticks (H1 and H4 are always included for SMCBot) ---
+TIMEFRAMES = ('H1', 'H4')
+
+# --- Latency metrics: per-stage histograms (1 in METRICS_SAMPLE_EVERY ticks), dumped to METRICS_FILE
+# --- on exit or SIGUSR1, and served as JSON on 127.0.0.1:METRICS_PORT when the port is non-zero ---
+METRICS = False
+METRICS_SAMPLE_EVERY = 32
+METRICS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metrics.json')
+METRICS_PORT = 0
+
+# --- Analysis backend: 'dict' (lists of candle dicts), 'columnar' (NumPy columns)
+# --- or 'incremental' (running structure indexes updated per closed candle) ---
+SMC_ENGINE = 'incremental'
+
 # ==============================================================================
 #  SMC ANALYSIS ENGINE (The core trading logic)
 # ==============================================================================
 class SMCBot:
-    def __init__(self, instrument_name: str):
+    def __init__(self, instrument_name: str, min_candles: int = 5, default_tp_pct: float = 0.005, strong_body_ratio: float = 1.0):
         self.instrument = instrument_name
+        # --- Tunable strategy parameters (see run_sweep) ---
+        self.min_candles = min_candles              # Minimum H4 and H1 candles before analysing
+        self.default_tp_pct = default_tp_pct        # TP distance when no swing target exists
+        self.strong_body_ratio = strong_body_ratio  # OB confirmation body must exceed this multiple of the OB body
         self.mitigated_h4_pois = set()
         self.mitigated_h1_pois = set()
 
     def analyze(self, h4_data: List[Dict], h1_data: List[Dict]) -> Dict:
-        if len(h4_data) < 5 or len(h1_data) < 5:
+        if len(h4_data) < self.min_candles or len(h1_data) < self.min_candles:
             return self._format_no_trade("INVALID_STRUCTURE", "Waiting for more candle data.")
 
         bias_analysis = self._get_4h_bias(h4_data)
@@ -71,11 +167,11 @@ class SMCBot:
         if bias == "BUY":
             sl = float(poi['low'])
             tps = [s for s in swings['highs'] if s.get('time', 0) > poi.get('time', 0)]
-            tp = float(tps[0]['high']) if tps else entry * 1.005 # Default TP
+            tp = float(tps[0]['high']) if tps else entry * (1 + self.default_tp_pct) # Default TP
         else: # SELL
             sl = float(poi['high'])
             tps = [s for s in swings['lows'] if s.get('time',0) > poi.get('time',0)]
-            tp = float(tps[0]['low']) if tps else entry * 0.995 # Default TP
+            tp = float(tps[0]['low']) if tps else entry * (1 - self.default_tp_pct) # Default TP
 
         trade = {
             "action": "taketrade", "order_type": bias, "entry": entry, 
@@ -151,7 +247,7 @@ class SMCBot:
         if len(data) < 2: return order_blocks
         for i in range(1, len(data)):
             p, c = data[i-1], data[i]
-            strong = abs(c['close'] - c['open']) > abs(p['close'] - p['open'])
+            strong = abs(c['close'] - c['open']) > abs(p['close'] - p['open']) * self.strong_body_ratio
             if direction=="bullish" and p['close']<p['open'] and c['close']>c['open'] and strong: order_blocks.append(p)
             if direction=="bearish" and p['close']>p['open'] and c['close']<c['open'] and strong: order_blocks.append(p)
         return order_blocks
@@ -164,6 +260,295 @@ class SMCBot:
     def _format_no_trade(self, reason: str, details: str) -> Dict:
         return {"action": "don'ttaketrade", "reason": reason, "details": details}
 
+# ==============================================================================
+#  COLUMNAR SMC ANALYSIS ENGINE (NumPy-vectorized backend for SMCBot)
+# ==============================================================================
+class CandleColumns:
+    """Growable contiguous candle columns (time, open, high, low, close) for one timeframe."""
+    def __init__(self, capacity: int = 256):
+        self.size = 0
+        self._time = np.empty(capacity, dtype=np.int64)
+        self._ohlc = np.empty((4, capacity), dtype=np.float64)
+
+    @classmethod
+    def from_dicts(cls, candles: List[Dict]) -> 'CandleColumns':
+        cols = cls(max(len(candles), 256))
+        cols.extend(candles)
+        return cols
+
+    def __len__(self) -> int: return self.size
+
+    @property
+    def time(self) -> np.ndarray: return self._time[:self.size]
+    @property
+    def open(self) -> np.ndarray: return self._ohlc[0, :self.size]
+    @property
+    def high(self) -> np.ndarray: return self._ohlc[1, :self.size]
+    @property
+    def low(self) -> np.ndarray: return self._ohlc[2, :self.size]
+    @property
+    def close(self) -> np.ndarray: return self._ohlc[3, :self.size]
+
+    def _reserve(self, needed: int):
+        if needed <= len(self._time): return
+        capacity = max(needed, 2 * len(self._time))
+        time_col = np.empty(capacity, dtype=np.int64); time_col[:self.size] = self._time[:self.size]
+        ohlc = np.empty((4, capacity), dtype=np.float64); ohlc[:, :self.size] = self._ohlc[:, :self.size]
+        self._time, self._ohlc = time_col, ohlc
+
+    def extend(self, candles: List[Dict]):
+        if not candles: return
+        n, end = self.size, self.size + len(candles)
+        self._reserve(end)
+        self._time[n:end] = [c['time'] for c in candles]
+        self._ohlc[:, n:end] = [[c['open'] for c in candles], [c['high'] for c in candles],
+                                [c['low'] for c in candles], [c['close'] for c in candles]]
+        self.size = end
+
+    def append(self, candle: Dict): self.extend([candle])
+
+    def sync(self, candles: List[Dict]) -> bool:
+        """Appends the unseen tail of a growing candle list. Returns False if the list no longer extends these columns."""
+        if len(candles) < self.size: return False
+        if self.size and candles[self.size - 1]['time'] != self._time[self.size - 1]: return False
+        self.extend(candles[self.size:])
+        return True
+
+    def row(self, i: int) -> Dict:
+        i = int(i)
+        return {"time": int(self._time[i]), "open": float(self._ohlc[0, i]), "high": float(self._ohlc[1, i]),
+                "low": float(self._ohlc[2, i]), "close": float(self._ohlc[3, i])}
+
+
+class ColumnarSMCBot(SMCBot):
+    """Same decisions as SMCBot, computed with array operations over CandleColumns (candles in ascending time order)."""
+    columns_type = CandleColumns
+
+    def __init__(self, instrument_name: str, **params):
+        super().__init__(instrument_name, **params)
+        self._h4_cols = self._new_columns([])
+        self._h1_cols = self._new_columns([])
+
+    def _new_columns(self, candles: List[Dict]) -> CandleColumns:
+        return self.columns_type.from_dicts(candles)
+
+    def analyze(self, h4_data: Union[List[Dict], CandleColumns], h1_data: Union[List[Dict], CandleColumns]) -> Dict:
+        if not isinstance(h4_data, self.columns_type):
+            if not self._h4_cols.sync(h4_data): self._h4_cols = self._new_columns(h4_data)
+            h4_data = self._h4_cols
+        if not isinstance(h1_data, self.columns_type):
+            if not self._h1_cols.sync(h1_data): self._h1_cols = self._new_columns(h1_data)
+            h1_data = self._h1_cols
+        return super().analyze(h4_data, h1_data)
+
+    def _prepare_trade(self, bias: str, poi: Dict, h1_data: CandleColumns) -> Dict:
+        entry = float(poi['high'] if bias == "SELL" else poi['low'])
+        swings = self._get_swing_points(h1_data)
+        if bias == "BUY":
+            sl = float(poi['low'])
+            tp_idx = self._first_swing_after(swings['highs'], h1_data, poi['time'])
+            tp = float(h1_data.high[tp_idx]) if tp_idx is not None else entry * (1 + self.default_tp_pct) # Default TP
+        else: # SELL
+            sl = float(poi['high'])
+            tp_idx = self._first_swing_after(swings['lows'], h1_data, poi['time'])
+            tp = float(h1_data.low[tp_idx]) if tp_idx is not None else entry * (1 - self.default_tp_pct) # Default TP
+
+        trade = {
+            "action": "taketrade", "order_type": bias, "entry": entry,
+            "sl": sl, "tp": tp, "units": 0 # Units will be calculated later
+        }
+
+        self.mitigated_h1_pois.clear(); self.mitigated_h4_pois.clear()
+        return trade
+
+    def _get_4h_bias(self, h4_data: CandleColumns) -> Dict:
+        swings = self._get_swing_points(h4_data)
+        if not len(swings['highs']) or not len(swings['lows']): return {"error": "...", "reason": "INVALID_STRUCTURE"}
+        poi = self._find_setup(h4_data, swings, "bullish")
+        if poi is not None: return {"bias": "BUY", "poi": h4_data.row(poi)}
+        poi = self._find_setup(h4_data, swings, "bearish")
+        if poi is not None: return {"bias": "SELL", "poi": h4_data.row(poi)}
+        return {"error": "Waiting for 4H liquidity sweep & MSS.", "reason": "NO_SETUP"}
+
+    def _get_1h_entry(self, bias: str, h1_data: CandleColumns) -> Dict:
+        swings = self._get_swing_points(h1_data)
+        if not len(swings['highs']) or not len(swings['lows']): return {"error": "...", "reason": "INVALID_STRUCTURE"}
+        direction = "bullish" if bias == "BUY" else "bearish" if bias == "SELL" else None
+        poi = self._find_setup(h1_data, swings, direction, is_1h=True) if direction else None
+        if poi is not None: return {"poi": h1_data.row(poi)}
+        return {"error": "Waiting for 1H liquidity sweep & MSS.", "reason": "NO_SETUP"}
+
+    def _find_setup(self, data: CandleColumns, swings: Dict, direction: str, is_1h: bool = False) -> Optional[int]:
+        """Sweep -> MSS -> order block chain shared by the 4H bias and 1H entry; returns the POI index."""
+        if direction == "bullish":
+            swept = self._find_liquidity_sweep(swings['lows'], data, "low", is_mini=is_1h)
+            if swept is None: return None
+            mss = self._find_mss(swept, swings['highs'], data)
+            if mss is None or not data.close[-1] > data.high[mss]: return None
+        else:
+            swept = self._find_liquidity_sweep(swings['highs'], data, "high", is_mini=is_1h)
+            if swept is None: return None
+            mss = self._find_mss(swept, swings['lows'], data)
+            if mss is None or not data.close[-1] < data.low[mss]: return None
+        return self._find_poi_after_mss(mss, data, direction, is_1h=is_1h)
+
+    def _get_swing_points(self, data: CandleColumns) -> Dict:
+        if len(data) < 3: return {"highs": np.empty(0, dtype=np.intp), "lows": np.empty(0, dtype=np.intp)}
+        high, low = data.high, data.low
+        mid_high, mid_low = high[1:-1], low[1:-1]
+        highs = np.flatnonzero((mid_high >= high[:-2]) & (mid_high > high[2:])) + 1
+        lows = np.flatnonzero((mid_low <= low[:-2]) & (mid_low < low[2:])) + 1
+        return {"highs": highs, "lows": lows}
+
+    def _find_liquidity_sweep(self, swings: np.ndarray, data: CandleColumns, side: str, is_mini: bool = False) -> Optional[int]:
+        if not len(swings): return None
+        last_swing = swings[-1]
+        if side == "low" and data.low[-1] < data.low[last_swing]: return int(last_swing)
+        if side == "high" and data.high[-1] > data.high[last_swing]: return int(last_swing)
+        return None
+
+    def _find_mss(self, swept_point: int, opposite_swings: np.ndarray, data: CandleColumns) -> Optional[int]:
+        k = np.searchsorted(data.time[opposite_swings], data.time[swept_point], side='left')
+        return int(opposite_swings[k - 1]) if k else None
+
+    def _first_swing_after(self, swings: np.ndarray, data: CandleColumns, t: int) -> Optional[int]:
+        k = np.searchsorted(data.time[swings], t, side='right')
+        return int(swings[k]) if k < len(swings) else None
+
+    def _find_poi_after_mss(self, mss_point: int, data: CandleColumns, direction: str, is_1h: bool = False) -> Optional[int]:
+        start = int(np.searchsorted(data.time, data.time[mss_point], side='right'))
+        order_blocks = self._find_order_blocks(data, direction, start)
+        mitigated_pois = self.mitigated_h1_pois if is_1h else self.mitigated_h4_pois
+        times = data.time
+        for ob in order_blocks[::-1]:
+            if int(times[ob]) not in mitigated_pois: return int(ob)
+        return None
+
+    def _find_order_blocks(self, data: CandleColumns, direction: str, start: int = 0) -> np.ndarray:
+        body = data.close[start:] - data.open[start:]
+        if len(body) < 2: return np.empty(0, dtype=np.intp)
+        prev_body, cur_body = body[:-1], body[1:]
+        strong = np.abs(cur_body) > np.abs(prev_body) * self.strong_body_ratio
+        if direction == "bullish": mask = (prev_body < 0) & (cur_body > 0) & strong
+        else: mask = (prev_body > 0) & (cur_body < 0) & strong
+        return np.flatnonzero(mask) + start
+
+    def _is_mitigated(self, poi: Dict, data: CandleColumns) -> bool:
+        if not poi or 'time' not in poi: return False
+        start = np.searchsorted(data.time, poi['time'], side='right')
+        return bool(np.any((data.low[start:] <= poi['high']) & (data.high[start:] >= poi['low'])))
+
+
+# ==============================================================================
+#  INCREMENTAL SMC STATE (structure indexes updated once per closed candle)
+# ==============================================================================
+class StructureIndex:
+    """Closed candles of one timeframe plus running swing-point and order-block indexes, updated in O(1) amortized per append."""
+    def __init__(self, strong_body_ratio: float = 1.0):
+        self.strong_body_ratio = strong_body_ratio
+        self.time, self.open, self.high, self.low, self.close = [], [], [], [], []
+        self.swing_highs, self.swing_lows = [], []
+        self.bullish_obs, self.bearish_obs = [], []
+        self._mitigation_scan = {}
+
+    @classmethod
+    def from_dicts(cls, candles: List[Dict], strong_body_ratio: float = 1.0) -> 'StructureIndex':
+        index = cls(strong_body_ratio)
+        for c in candles: index.append(c)
+        return index
+
+    def __len__(self) -> int: return len(self.time)
+
+    def append(self, candle: Dict):
+        self.time.append(candle['time']); self.open.append(candle['open']); self.high.append(candle['high'])
+        self.low.append(candle['low']); self.close.append(candle['close'])
+        n = len(self.time)
+        if n >= 3:
+            i, high, low = n - 2, self.high, self.low
+            if high[i] >= high[i-1] and high[i] > high[i+1]: self.swing_highs.append(i)
+            if low[i] <= low[i-1] and low[i] < low[i+1]: self.swing_lows.append(i)
+        if n >= 2:
+            p, c = n - 2, n - 1
+            p_body, c_body = self.close[p] - self.open[p], self.close[c] - self.open[c]
+            strong = abs(c_body) > abs(p_body) * self.strong_body_ratio
+            if p_body < 0 and c_body > 0 and strong: self.bullish_obs.append(p)
+            if p_body > 0 and c_body < 0 and strong: self.bearish_obs.append(p)
+
+    def sync(self, candles: List[Dict]) -> bool:
+        """Appends the unseen tail of a growing candle list. Returns False if the list no longer extends this index."""
+        n = len(self.time)
+        if len(candles) < n: return False
+        if n and candles[n - 1]['time'] != self.time[n - 1]: return False
+        for c in candles[n:]: self.append(c)
+        return True
+
+    def row(self, i: int) -> Dict:
+        return {"time": self.time[i], "open": self.open[i], "high": self.high[i], "low": self.low[i], "close": self.close[i]}
+
+    def is_mitigated(self, poi: Dict) -> bool:
+        """True once any candle after the POI has traded into its range; the result is cached per POI."""
+        key = (poi['time'], poi['high'], poi['low'])
+        k = self._mitigation_scan.get(key)
+        if k is True: return True
+        if k is None: k = bisect_right(self.time, poi['time'])
+        low, high, poi_high, poi_low = self.low, self.high, poi['high'], poi['low']
+        for j in range(k, len(self.time)):
+            if low[j] <= poi_high and high[j] >= poi_low:
+                self._mitigation_scan[key] = True
+                return True
+        self._mitigation_scan[key] = len(self.time)
+        return False
+
+
+class IncrementalSMCBot(ColumnarSMCBot):
+    """SMCBot decisions from StructureIndex state that is updated per closed candle, not rescanned."""
+    columns_type = StructureIndex
+
+    def __init__(self, instrument_name: str, **params):
+        super().__init__(instrument_name, **params)
+        self._bias_cache_key = None
+        self._bias_cache = None
+
+    def _new_columns(self, candles: List[Dict]) -> StructureIndex:
+        return StructureIndex.from_dicts(candles, self.strong_body_ratio)
+
+    def _get_4h_bias(self, h4_data: StructureIndex) -> Dict:
+        key = (id(h4_data), len(h4_data), h4_data.time[-1] if len(h4_data) else None, frozenset(self.mitigated_h4_pois))
+        if key != self._bias_cache_key:
+            self._bias_cache = super()._get_4h_bias(h4_data)
+            self._bias_cache_key = key
+        return dict(self._bias_cache)
+
+    def _get_swing_points(self, data: StructureIndex) -> Dict:
+        return {"highs": data.swing_highs, "lows": data.swing_lows}
+
+    def _find_mss(self, swept_point: int, opposite_swings: List[int], data: StructureIndex) -> Optional[int]:
+        k = bisect_left(opposite_swings, data.time[swept_point], key=data.time.__getitem__)
+        return opposite_swings[k - 1] if k else None
+
+    def _first_swing_after(self, swings: List[int], data: StructureIndex, t: int) -> Optional[int]:
+        k = bisect_right(swings, t, key=data.time.__getitem__)
+        return swings[k] if k < len(swings) else None
+
+    def _find_poi_after_mss(self, mss_point: int, data: StructureIndex, direction: str, is_1h: bool = False) -> Optional[int]:
+        mss_time, times = data.time[mss_point], data.time
+        mitigated_pois = self.mitigated_h1_pois if is_1h else self.mitigated_h4_pois
+        for ob in reversed(self._find_order_blocks(data, direction)):
+            if times[ob] <= mss_time: break
+            if times[ob] not in mitigated_pois: return ob
+        return None
+
+    def _find_order_blocks(self, data: StructureIndex, direction: str, start: int = 0) -> List[int]:
+        order_blocks = data.bullish_obs if direction == "bullish" else data.bearish_obs
+        return order_blocks[bisect_left(order_blocks, start):] if start else order_blocks
+
+    def _is_mitigated(self, poi: Dict, data: StructureIndex) -> bool:
+        if not poi or 'time' not in poi: return False
+        return data.is_mitigated(poi)
+
+
+SMC_ENGINES = {'dict': SMCBot, 'columnar': ColumnarSMCBot, 'incremental': IncrementalSMCBot}
+
 # ==============================================================================
 #  DASHBOARD AND VISUALS
 # ==============================================================================
@@ -171,57 +556,1048 @@ class Dashboard:
     def __init__(self):
         self.spinner_chars = ['|', '/', '—', '\\']
         self.spinner_index = 0
+        self._last_frame = None
 
     def get_spinner(self):
         char = self.spinner_chars[self.spinner_index]
         self.spinner_index = (self.spinner_index + 1) % len(self.spinner_chars)
         return char
 
-    def render(self, state: Dict):
-        os.system('cls' if os.name == 'nt' else 'clear')
-        
-        print(Style.BRIGHT + Fore.CYAN + "=== Israel devReal-Time Trading Bot cred:fumcy❤️===")
-        print(f"Status: {Fore.GREEN}{state['connection_status']}{Style.RESET_ALL} | Uptime: {state['uptime']} | Max Risk: ${RISK_PER_TRADE_USD}")
-        print("-" * 60)
+    def build_lines(self, state: Dict) -> List[str]:
+        lines = []
+        out = lines.append
+        out(Style.BRIGHT + Fore.CYAN + "=== Israel devReal-Time Trading Bot cred:fumcy❤️===")
+        out(f"Status: {Fore.GREEN}{state['connection_status']}{Style.RESET_ALL} | Uptime: {state['uptime']} | Max Risk: ${state.get('max_risk_usd', RISK_PER_TRADE_USD)}")
+        out("-" * 60)
 
-        print(Style.BRIGHT + Fore.YELLOW + "\n--- Market Watch ---")
+        out(""); out(Style.BRIGHT + Fore.YELLOW + "--- Market Watch ---")
         header = f"{'Instrument':<12} | {'Price':<12} | {'Spread (pips)':<15} | {'Candles (1H/4H)':<16} | {'SMC Analysis Status'}"
-        print(header); print("-" * len(header))
+        out(header); out("-" * len(header))
         for inst, data in state['instruments'].items():
-            price_str = f"{data['price']:.2f}"
+            price_str = f"{data['price']:.{price_decimals(inst)}f}"
             candle_str = f"{data['h1_candles_count']} / {data['h4_candles_count']}"
             spread_str = f"{data['spread']:.1f}"
             status_color = Fore.YELLOW if 'Waiting' in data['analysis_status'] else Fore.CYAN
-            print(f"{Fore.WHITE}{inst:<12}{Style.RESET_ALL} | {data['spinner']} {price_str:<10} | {spread_str:<15} | {candle_str:<16} | {status_color}{data['analysis_status']}")
+            out(f"{Fore.WHITE}{inst:<12}{Style.RESET_ALL} | {data['spinner']} {price_str:<10} | {spread_str:<15} | {candle_str:<16} | {status_color}{data['analysis_status']}")
 
-        active_trades_exist = any(data['active_trade'] for data in state['instruments'].values())
+        active_trades_exist = any(data['positions'] for data in state['instruments'].values())
         if active_trades_exist:
-            print(Style.BRIGHT + Fore.GREEN + "\n--- Active Trades ---")
-            trade_header = f"{'Instrument':<12} | {'Type':<5} | {'Lots':<10} | {'P/L (USD)':<15}"
-            print(trade_header); print("-" * len(trade_header))
+            open_pnl = sum(data['live_pnl_usd'] for data in state['instruments'].values() if data['positions'])
+            out(""); out(Style.BRIGHT + Fore.GREEN + f"--- Active Trades (open P/L ${open_pnl:+.2f}) ---")
+            trade_header = f"{'Instrument':<12} | {'#':<4} | {'Type':<5} | {'Lots':<10} | {'P/L (USD)':<15}"
+            out(trade_header); out("-" * len(trade_header))
             for inst, data in state['instruments'].items():
-                if data['active_trade']:
-                    trade = data['active_trade']
+                for trade in data['positions']:
                     pnl_usd = trade['live_pnl_usd']
                     pnl_color = Fore.GREEN if pnl_usd >= 0 else Fore.RED
                     lots_str = f"{trade.get('units', 0) / 100000.0:.2f}"
-                    print(f"{Fore.WHITE}{inst:<12}{Style.RESET_ALL} | {trade['order_type']:<5} | {lots_str:<10} | {pnl_color}${pnl_usd:+.2f}")
+                    out(f"{Fore.WHITE}{inst:<12}{Style.RESET_ALL} | {trade['id']:<4} | {trade['order_type']:<5} | {lots_str:<10} | {pnl_color}${pnl_usd:+.2f}")
         
-        print(Style.BRIGHT + Fore.WHITE + "\n--- Event Log ---")
-        if not state['logs']: print(f"{Style.DIM}No new events.")
-        for log in state['logs'][-5:]: print(f"{Style.DIM}{log}")
+        latency = state.get('latency')
+        if latency:
+            out(""); out(Style.BRIGHT + Fore.MAGENTA + f"--- Latency (µs, 1 in {latency['sample_every']} ticks) ---")
+            stage_header = f"{'Stage':<14} | {'p50':>9} | {'p99':>9} | {'max':>9} | {'Count':>9}"
+            out(stage_header); out("-" * len(stage_header))
+            for name, s in latency['stages_us'].items():
+                if s['count']: out(f"{name:<14} | {s['p50']:>9.1f} | {s['p99']:>9.1f} | {s['max']:>9.1f} | {s['count']:>9}")
+            out(f"{'Instrument':<14} | {'Ticks/s':>9} | {'Lag p50 (ms)':>12} | {'Lag p99 (ms)':>12}")
+            for inst, rate in latency['ticks_per_s'].items():
+                lag = latency['tick_lag_ms'][inst]
+                lag_str = f"{lag['p50']:>12.1f} | {lag['p99']:>12.1f}" if lag['count'] else f"{'-':>12} | {'-':>12}"
+                out(f"{inst:<14} | {rate:>9.1f} | {lag_str}")
+
+        out(""); out(Style.BRIGHT + Fore.WHITE + "--- Event Log ---")
+        if not state['logs']: out(f"{Style.DIM}No new events.")
+        for log in state['logs'][-5:]: out(f"{Style.DIM}{log}")
+        return [line + Style.RESET_ALL for line in lines]
+
+    def render(self, state: Dict):
+        """Repaints only the lines that changed since the last frame, using ANSI cursor moves."""
+        lines = self.build_lines(state)
+        previous = self._last_frame
+        chunks = [] if previous is not None else ["\x1b[2J"]
+        for row, line in enumerate(lines):
+            if previous is None or row >= len(previous) or previous[row] != line:
+                chunks.append(f"\x1b[{row + 1};1H{line}\x1b[K")
+        if previous is not None and len(previous) > len(lines):
+            chunks.append(f"\x1b[{len(lines) + 1};1H\x1b[J")
+        if chunks:  # Autowrap off while drawing: a line wider than the terminal is cut, not spilled onto the next row
+            chunks.append(f"\x1b[{len(lines) + 1};1H")
+            sys.stdout.write("\x1b[?7l" + "".join(chunks) + "\x1b[?7h"); sys.stdout.flush()
+        self._last_frame = lines
+
+class DashboardRenderer(threading.Thread):
+    """Renders a trader's state snapshot at a fixed frame rate, off the tick-handling thread."""
+    def __init__(self, trader: 'LiveOandaTrader', fps: float = DASHBOARD_FPS):
+        super().__init__(name="dashboard", daemon=True)
+        self.trader = trader
+        self.interval = 1.0 / fps
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            state = self.trader.snapshot()
+            started = time.perf_counter_ns()
+            self.trader.dashboard.render(state)
+            if self.trader.monitor: self.trader.monitor.record('render', time.perf_counter_ns() - started)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+# ==============================================================================
+#  HOT-PATH LATENCY INSTRUMENTATION (fixed-memory HDR-style histograms)
+# ==============================================================================
+class LatencyHistogram:
+    """Log-linear nanosecond histogram in the style of HdrHistogram (~3% relative error, fixed memory)."""
+    def __init__(self, max_ns: int = 1 << 40):
+        self.max_ns = max_ns
+        self.counts = [0] * (self._index(max_ns) + 1)
+        self.total = 0
+        self.sum = 0
+        self.max = 0
+
+    @staticmethod
+    def _index(ns: int) -> int:
+        shift = ns.bit_length() - 6
+        return (shift << 5) + (ns >> shift) if shift > 0 else ns
+
+    @staticmethod
+    def _value(index: int) -> int:
+        """Highest value that lands in bucket `index`."""
+        shift = (index >> 5) - 1
+        return index if shift <= 0 else ((index - (shift << 5)) << shift) + (1 << shift) - 1
+
+    def record(self, ns: int):
+        if ns < 0: ns = 0
+        elif ns > self.max_ns: ns = self.max_ns
+        shift = ns.bit_length() - 6
+        self.counts[(shift << 5) + (ns >> shift) if shift > 0 else ns] += 1
+        self.total += 1
+        self.sum += ns
+        if ns > self.max: self.max = ns
+
+    def percentiles(self, ps: Iterable[float]) -> List[int]:
+        ps = sorted(ps)
+        targets = [max(1, -(-int(p * self.total) // 100)) for p in ps]
+        values, seen, i = [], 0, 0
+        for index, count in enumerate(self.counts):
+            if not count: continue
+            seen += count
+            while i < len(targets) and seen >= targets[i]:
+                values.append(min(self._value(index), self.max)); i += 1
+            if i == len(targets): break
+        return values + [self.max] * (len(targets) - len(values))
+
+    def summary(self, unit: float = 1e3) -> Dict:
+        """Count, mean and percentiles, converted from nanoseconds by dividing by `unit` (default µs)."""
+        if not self.total: return {"count": 0}
+        p50, p90, p99, p999 = self.percentiles((50, 90, 99, 99.9))
+        return {"count": self.total, "mean": self.sum / self.total / unit, "p50": p50 / unit, "p90": p90 / unit,
+                "p99": p99 / unit, "p99.9": p999 / unit, "max": self.max / unit}
+
+class LatencyMonitor:
+    """Per-stage latency histograms, per-instrument tick counts/rates and tick lag for one trader; per-tick stages are timed
+    on one tick in `sample_every`."""
+    STAGES = ('decode', 'handle_tick', 'track_trade', 'aggregate', 'process_price', 'analyze', 'render')
+
+    def __init__(self, instruments: Iterable[str], sample_every: int = METRICS_SAMPLE_EVERY):
+        self.sample_every = max(1, sample_every)
+        self.stages = {name: LatencyHistogram() for name in self.STAGES}
+        self.ticks = {inst: 0 for inst in instruments}
+        self.lag = {inst: LatencyHistogram() for inst in self.ticks}
+        self.started = time.time()
+        self._rng = random.Random()
+        self.countdown = self._line_countdown = self.sample_every
+        self._rate_mark = (time.monotonic(), dict(self.ticks))
+        self._rates = {inst: 0.0 for inst in self.ticks}
+        self.gateway = None  # An OrderGateway whose order latencies are reported alongside
+
+    def record(self, stage: str, ns: int): self.stages[stage].record(ns)
+
+    def due(self) -> bool:
+        """True for one in `sample_every` calls; stream loops use it to sample decoding."""
+        self._line_countdown -= 1
+        if self._line_countdown: return False
+        self._line_countdown = self.sample_every
+        return True
+
+    def sample(self, inst: str, ts: float) -> int:
+        """Called when `countdown` reaches zero: re-arms it, records the tick's lag and returns a perf_counter_ns() start."""
+        self.countdown = int(self._rng.random() * (2 * self.sample_every - 1)) + 1
+        self.lag[inst].record(int((time.time() - ts) * 1e9))
+        return time.perf_counter_ns()
+
+    def ticks_per_second(self) -> Dict[str, float]:
+        """Per-instrument tick rate over the last window of at least one second."""
+        now, (mark, counts) = time.monotonic(), self._rate_mark
+        if now - mark >= 1.0:
+            current = dict(self.ticks)
+            self._rates = {inst: (n - counts.get(inst, 0)) / (now - mark) for inst, n in current.items()}
+            self._rate_mark = (now, current)
+        return self._rates
+
+    def report(self) -> Dict:
+        report = {"sample_every": self.sample_every, "uptime_s": time.time() - self.started,
+                  "stages_us": {name: h.summary() for name, h in self.stages.items()},
+                  "tick_lag_ms": {inst: h.summary(1e6) for inst, h in self.lag.items()},
+                  "ticks": dict(self.ticks), "ticks_per_s": self.ticks_per_second()}
+        if self.gateway: report["orders"] = self.gateway.report()
+        return report
+
+    def dump(self, path: str = METRICS_FILE):
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f: json.dump(self.report(), f, indent=2)
+        os.replace(tmp, path)
+
+    def serve(self, port: int = METRICS_PORT, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+        """Serves report() as JSON at http://host:port/metrics from a daemon thread."""
+        monitor = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ('/', '/metrics'): self.send_error(404); return
+                body = json.dumps(monitor.report(), indent=2).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json'); self.send_header('Content-Length', str(len(body)))
+                self.end_headers(); self.wfile.write(body)
+            def log_message(self, *args): pass
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+# ==============================================================================
+#  ASYNCIO STREAMING CLIENT (raw HTTP/1.1, fast-path decoding, burst batches)
+# ==============================================================================
+_HEARTBEAT_MARK = b'"HEARTBEAT"'
+_PRICE_KEYS = (b'"instrument":"', b'"time":"', b'"bids":[{"price":"', b'"asks":[{"price":"')
+
+def decode_price_line(line: bytes) -> Optional[Tuple[str, str, float, float]]:
+    """Fast path for one pricing-stream line: (instrument, time, bid, ask), or None for heartbeats/other messages."""
+    if _HEARTBEAT_MARK in line: return None
+    fields = []
+    for key in _PRICE_KEYS:
+        i = line.find(key)
+        if i < 0: break
+        i += len(key)
+        fields.append(line[i:line.find(b'"', i)])
+    else:
+        try: return fields[0].decode(), fields[1].decode(), float(fields[2]), float(fields[3])
+        except ValueError: pass
+    try:
+        msg = json.loads(line)
+        if msg.get('type') != 'PRICE': return None
+        return msg['instrument'], msg['time'], float(msg['bids'][0]['price']), float(msg['asks'][0]['price'])
+    except (ValueError, KeyError, IndexError, TypeError): return None
+
+class StreamHTTPError(Exception):
+    def __init__(self, status: int, body: str):
+        super().__init__(f"HTTP {status}: {body}")
+        self.status = status
+
+class AsyncPriceStream:
+    """Minimal asyncio HTTP/1.1 client for a line-delimited (optionally chunked) streaming response; batches() yields the
+    complete lines of each network read as one list."""
+    def __init__(self, url: str, headers: Dict, params: Dict, connect_timeout: float = 10.0, read_timeout: float = 30.0):
+        parts = urlsplit(url)
+        self.tls = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.tls else 80)
+        self.target = parts.path + ('?' + urlencode(params) if params else '')
+        self.headers = headers
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    async def batches(self) -> AsyncIterator[List[bytes]]:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=ssl.create_default_context() if self.tls else None), self.connect_timeout)
+        try:
+            request = [f"GET {self.target} HTTP/1.1", f"Host: {self.host}", "Accept-Encoding: identity", "Connection: keep-alive"]
+            request += [f"{k}: {v}" for k, v in self.headers.items()]
+            writer.write(("\r\n".join(request) + "\r\n\r\n").encode())
+            await writer.drain()
+
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.read_timeout)
+            status_line, *header_lines = head.decode('latin-1').split("\r\n")
+            status = int(status_line.split()[1])
+            response_headers = {k.strip().lower(): v.strip() for k, _, v in (h.partition(':') for h in header_lines if h)}
+            chunked = response_headers.get('transfer-encoding', '').lower() == 'chunked'
+            if status != 200:
+                body = await asyncio.wait_for(reader.read(4096), self.read_timeout)
+                raise StreamHTTPError(status, body.decode('utf-8', 'replace'))
+
+            raw, pending, finished = b"", b"", False
+            while not finished:
+                data = await asyncio.wait_for(reader.read(262144), self.read_timeout)
+                if not data: finished = True
+                if chunked:
+                    raw += data
+                    body, pos = [], 0
+                    while True:
+                        eol = raw.find(b"\r\n", pos)
+                        if eol < 0: break
+                        size = int(raw[pos:eol].split(b';')[0], 16)
+                        if size == 0: finished = True; break
+                        if len(raw) < eol + 2 + size + 2: break
+                        body.append(raw[eol + 2:eol + 2 + size])
+                        pos = eol + 2 + size + 2
+                    raw = raw[pos:]
+                    data = b"".join(body)
+                pending += data
+                if b"\n" not in data: continue
+                *lines, pending = pending.split(b"\n")
+                yield lines
+        finally:
+            writer.close()
+
+# ==============================================================================
+#  WARM START (bulk historical candles through a memory-mapped on-disk cache)
+# ==============================================================================
+CANDLE_RECORD_DTYPE = np.dtype([('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8')])
+
+class CandleCache:
+    """Append-only fixed-width candle files, one per instrument and granularity, read back with np.memmap."""
+    def __init__(self, directory: str = CANDLE_CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, inst: str, granularity: str) -> str:
+        return os.path.join(self.directory, f"{inst}_{granularity}.candles")
+
+    def load(self, inst: str, granularity: str) -> np.ndarray:
+        path = self.path(inst, granularity)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        records = size // CANDLE_RECORD_DTYPE.itemsize  # A torn final record from a crash is ignored
+        if not records: return np.empty(0, dtype=CANDLE_RECORD_DTYPE)
+        return np.memmap(path, dtype=CANDLE_RECORD_DTYPE, mode='r', shape=(records,))
+
+    def append(self, inst: str, granularity: str, candles: np.ndarray):
+        if not len(candles): return
+        path = self.path(inst, granularity)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        with open(path, 'r+b' if size else 'wb') as f:
+            f.seek(size - size % CANDLE_RECORD_DTYPE.itemsize)
+            f.write(candles.astype(CANDLE_RECORD_DTYPE, copy=False).tobytes())
+            f.truncate()
+
+class WarmStarter:
+    """Loads recent H1/H4 history before streaming starts: cached candles plus a top-up of anything newer from the OANDA candles endpoint."""
+    def __init__(self, api_url: str, headers: Dict, cache: CandleCache, candles: int = WARM_START_CANDLES, timeout: float = 10.0,
+                 workers: int = WARM_START_WORKERS):
+        self.api_url = api_url
+        self.cache = cache
+        self.candles = candles
+        self.timeout = timeout
+        self.workers = max(1, workers)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount('https://', adapter); self.session.mount('http://', adapter)
+        self.session.headers.update(headers)
+        self.session.headers['Accept-Datetime-Format'] = 'UNIX'
+
+    def fetch(self, inst: str, granularity: str, since: Optional[int] = None) -> np.ndarray:
+        """Complete mid candles newer than `since` (or the most recent `candles` of them), oldest first."""
+        params = {'granularity': granularity, 'price': 'M', 'alignmentTimezone': 'UTC', 'dailyAlignment': 0}
+        if since is None: params['count'] = min(self.candles, 5000)
+        else: params.update({'from': since, 'count': 5000})
+        rows = []
+        while True:
+            response = self.session.get(f"{self.api_url}/v3/instruments/{inst}/candles", params=params, timeout=self.timeout)
+            response.raise_for_status()
+            batch = response.json().get('candles', [])
+            added = 0
+            for c in batch:
+                t = int(float(c['time']))
+                if not c.get('complete') or (since is not None and t <= since): continue
+                mid = c['mid']
+                rows.append((t, float(mid['o']), float(mid['h']), float(mid['l']), float(mid['c']))); added += 1
+            if since is None or len(batch) < params['count'] or not added: break
+            params['from'] = since = rows[-1][0]
+        return np.array(rows, dtype=CANDLE_RECORD_DTYPE)
+
+    def load(self, inst: str, granularity: str, log: Callable[[str], None] = lambda message: None) -> List[Dict]:
+        """Cached candles topped up from the API; if the top-up fails, the cache alone (it raises only when there is none)."""
+        cached = self.cache.load(inst, granularity)
+        try: fresh = self.fetch(inst, granularity, int(cached['time'][-1]) if len(cached) else None)
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            if not len(cached): raise
+            log(f"⚠️ [{inst}] {granularity} top-up skipped, using {min(len(cached), self.candles)} cached candles: {e}")
+            fresh = cached[:0]
+        self.cache.append(inst, granularity, fresh)
+        if len(fresh): cached = self.cache.load(inst, granularity)
+        return [{"time": t, "open": o, "high": h, "low": l, "close": c, "volume": 0} for t, o, h, l, c in cached[-self.candles:].tolist()]
+
+# ==============================================================================
+#  INSTRUMENT SPECS (pip sizes and USD pip values for any OANDA pair)
+# ==============================================================================
+def resolve_instruments(spec: str) -> List[str]:
+    return FX_METALS_UNIVERSE.split(',') if spec.strip().upper() == 'ALL' else [inst.strip() for inst in spec.split(',') if inst.strip()]
+
+def pip_size(inst: str) -> float:
+    if inst in INSTRUMENT_PIPS: return INSTRUMENT_PIPS[inst][0]
+    if inst.startswith(('XAU_', 'XPT_', 'XPD_')): return 0.01
+    return PIP_SIZE_BY_QUOTE.get(inst.partition('_')[2], 0.0001)
+
+def price_decimals(inst: str) -> int:
+    if inst in INSTRUMENT_PRICE_DECIMALS: return INSTRUMENT_PRICE_DECIMALS[inst]
+    return max(0, int(round(-np.log10(pip_size(inst))))) + 1
+
+def pip_value_usd(inst: str, mid_price: Callable[[str], Optional[float]]) -> Optional[float]:
+    """USD value of a one-pip move on one unit, converting the quote currency at the latest
+    USD_<quote> or <quote>_USD mid from `mid_price`; None when no conversion rate is known yet."""
+    if inst in INSTRUMENT_PIPS: return INSTRUMENT_PIPS[inst][1]
+    base, _, quote = inst.partition('_')
+    if quote == 'USD': return pip_size(inst)
+    if base == 'USD':
+        price = mid_price(inst)
+        return pip_size(inst) / price if price else None
+    direct, inverse = mid_price(f"{quote}_USD"), mid_price(f"USD_{quote}")
+    if direct: return pip_size(inst) * direct
+    return pip_size(inst) / inverse if inverse else None
+
+# ==============================================================================
+#  POSITION BOOK (per-instrument SL/TP trigger index, incremental P/L)
+# ==============================================================================
+class PositionBook:
+    """Open positions of one instrument, with every SL and TP level in a heap per side and running totals for P/L.
+    A position is a trade dict plus `id` and `tp_levels`, [price, units] take-profits of which the last is `tp`."""
+    def __init__(self):
+        self.positions = {}
+        self.realized_pnl = 0.0
+        self._next_id = 1
+        self.clear()
+
+    def clear(self):
+        self.positions.clear()
+        self._long_sl, self._long_tp, self._short_sl, self._short_tp = [], [], [], []
+        self.long_units = self.long_cost = self.short_units = self.short_cost = 0.0
+
+    @staticmethod
+    def record(position: Dict) -> Dict:
+        """Copy of a position that stays valid while the live one is partially closed."""
+        return dict(position, tp_levels=[list(level) for level in position['tp_levels']])
+
+    @staticmethod
+    def pnl(position: Dict, bid: float, ask: float) -> float:
+        if position['order_type'] == 'BUY': return (bid - position['entry_price_with_spread']) * position['units']
+        return (position['entry_price_with_spread'] - ask) * position['units']
+
+    def add(self, position: Dict) -> Dict:
+        if 'id' not in position: position['id'] = self._next_id
+        self._next_id = max(self._next_id, position['id'] + 1)
+        if 'tp_levels' not in position: position['tp_levels'] = [[position['tp'], position['units']]]
+        self.positions[position['id']] = position
+        self._index(position)
+        units, cost = position['units'], position['units'] * position['entry_price_with_spread']
+        if position['order_type'] == 'BUY': self.long_units += units; self.long_cost += cost
+        else: self.short_units += units; self.short_cost += cost
+        return position
+
+    def _index(self, position: Dict):
+        pid, levels = position['id'], enumerate(position['tp_levels'])
+        if position['order_type'] == 'BUY':
+            heapq.heappush(self._long_sl, (-position['sl'], pid))
+            for level, (price, units) in levels:
+                if units: heapq.heappush(self._long_tp, (price, pid, level))
+        else:
+            heapq.heappush(self._short_sl, (position['sl'], pid))
+            for level, (price, units) in levels:
+                if units: heapq.heappush(self._short_tp, (-price, pid, level))
+
+    def triggered(self, bid: float, ask: float) -> List[Tuple[int, float, str, int, Optional[int]]]:
+        """Pops every level this quote crossed: (position id, exit price, reason, units, TP level or None for SL).
+        TP levels are marked filled here; the caller closes the units with close()."""
+        long_sl, long_tp, short_sl, short_tp = self._long_sl, self._long_tp, self._short_sl, self._short_tp
+        if not ((long_sl and -long_sl[0][0] >= bid) or (long_tp and long_tp[0][0] <= bid)
+                or (short_sl and short_sl[0][0] <= ask) or (short_tp and -short_tp[0][0] >= ask)): return []
+        positions, hits, stopped = self.positions, [], set()
+        for heap, price, crossed in ((long_sl, bid, lambda key: -key >= bid), (short_sl, ask, lambda key: key <= ask)):
+            while heap and crossed(heap[0][0]):
+                pid = heapq.heappop(heap)[1]
+                if pid in positions and pid not in stopped:
+                    stopped.add(pid); hits.append((pid, price, "STOP LOSS", positions[pid]['units'], None))
+        for heap, price, crossed in ((long_tp, bid, lambda key: key <= bid), (short_tp, ask, lambda key: -key >= ask)):
+            while heap and crossed(heap[0][0]):
+                _, pid, level = heapq.heappop(heap)
+                position = positions.get(pid)
+                if position is None or pid in stopped or not position['tp_levels'][level][1]: continue
+                levels = position['tp_levels']
+                units, levels[level][1] = levels[level][1], 0
+                hits.append((pid, price, "PARTIAL TP" if any(u for _, u in levels) else "TAKE PROFIT", units, level))
+        return hits
+
+    def close(self, pid: int, units: int, price: float, level: Optional[int] = None) -> float:
+        """Closes `units` of a position at `price` (all of it once none remain) and returns the realized P/L."""
+        position = self.positions[pid]
+        units, entry = min(units, position['units']), position['entry_price_with_spread']
+        if level is not None: position['tp_levels'][level][1] = 0
+        if position['order_type'] == 'BUY':
+            pnl = (price - entry) * units; self.long_units -= units; self.long_cost -= units * entry
+        else:
+            pnl = (entry - price) * units; self.short_units -= units; self.short_cost -= units * entry
+        self.realized_pnl += pnl
+        position['units'] -= units
+        if position['units'] <= 0:
+            del self.positions[pid]
+            if not self.positions: self.long_units = self.long_cost = self.short_units = self.short_cost = 0.0
+            elif len(self._long_sl) + len(self._long_tp) + len(self._short_sl) + len(self._short_tp) > 8 * len(self.positions) + 64:
+                self._long_sl, self._long_tp, self._short_sl, self._short_tp = [], [], [], []
+                for live in self.positions.values(): self._index(live)
+        return pnl
+
+    def unrealized(self, bid: float, ask: float) -> float:
+        return bid * self.long_units - self.long_cost + self.short_cost - ask * self.short_units
+
+# ==============================================================================
+#  ORDER GATEWAY (async OANDA v3 order submission over pooled keep-alive sessions)
+# ==============================================================================
+class OrderGateway:
+    """Sends position opens and closes to the OANDA v3 REST API from worker threads, without blocking the tick loop."""
+    STAGES = ('queue', 'broker', 'total')  # decision -> first send, last send -> ack, decision -> ack
+
+    def __init__(self, api_url: str, headers: Dict, account_id: str = ACCOUNT_ID, workers: int = ORDER_WORKERS,
+                 retries: int = ORDER_RETRIES, timeout: float = ORDER_TIMEOUT_S, keepalive: float = ORDER_KEEPALIVE_S,
+                 resubmits: int = ORDER_RESUBMITS):
+        self.base = f"{api_url.rstrip('/')}/v3/accounts/{account_id}"
+        self.headers = dict(headers, **{'Content-Type': 'application/json', 'Accept-Datetime-Format': 'UNIX'})
+        self.retries, self.timeout, self.keepalive, self.resubmits = retries, timeout, keepalive, resubmits
+        self.inboxes = [queue.SimpleQueue() for _ in range(max(1, workers))]
+        self.completed = deque()
+        self.latency = {stage: LatencyHistogram() for stage in self.STAGES}
+        self.counts = {'submitted': 0, 'filled': 0, 'closed': 0, 'rejected': 0, 'failed': 0, 'retries': 0}
+        self.threads = []
+        self._routes, self._templates = {}, {}
+        self._run = f"{int(time.time() * 1000):x}"  # Keeps client IDs unique across restarts
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.threads = [threading.Thread(target=self._worker, args=(inbox,), name=f"orders-{i}", daemon=True)
+                        for i, inbox in enumerate(self.inboxes)]
+        for thread in self.threads: thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Sends whatever is still queued, then stops the workers."""
+        for inbox in self.inboxes: inbox.put(None)
+        for thread in self.threads: thread.join(timeout)
+
+    def _template(self, inst: str) -> str:
+        self._templates[inst] = template = (
+            '{"order":{"type":"MARKET","instrument":"%s","units":"%%d","timeInForce":"FOK","positionFill":"DEFAULT",'
+            '"clientExtensions":{"id":"%%s"},"tradeClientExtensions":{"id":"%%s"},'
+            '"stopLossOnFill":{"price":"%%.%df","timeInForce":"GTC"}}}' % (inst, price_decimals(inst)))
+        return template
+
+    def submit_open(self, inst: str, position: Dict) -> Dict:
+        """Queues a market order for `position` (with its SL attached broker-side) and tags the position with its trade client ID."""
+        decided = time.perf_counter_ns()
+        trade_id = position['client_id'] = f"fx-{self._run}-{inst}-{position['id']}"
+        units = position['units'] if position['order_type'] == 'BUY' else -position['units']
+        body = ((self._templates.get(inst) or self._template(inst)) % (units, trade_id + '-o', trade_id, position['sl'])).encode()
+        return self._submit({'kind': 'open', 'inst': inst, 'position_id': position['id'], 'trade_client_id': trade_id,
+                             'method': 'POST', 'path': '/orders', 'body': body, 'units': units, 'decided': decided})
+
+    def submit_close(self, inst: str, position: Dict, units: int) -> Optional[Dict]:
+        """Queues a close of `units` of a position opened through the gateway (None for positions it never opened)."""
+        decided, trade_id = time.perf_counter_ns(), position.get('client_id')
+        if not trade_id: return None
+        remaining = max(position['units'] - units, 0)
+        body = b'{"units":"%d"}' % units if remaining else b'{"units":"ALL"}'
+        return self._submit({'kind': 'close', 'inst': inst, 'position_id': position['id'], 'trade_client_id': trade_id,
+                             'method': 'PUT', 'path': f"/trades/@{trade_id}/close", 'body': body, 'units': units,
+                             'remaining': remaining, 'decided': decided})
+
+    def resubmit(self, order: Dict) -> bool:
+        """Queues a FAILED order to be reconciled against the broker again (an open is never resent);
+        False once it has had `resubmits` rounds or the gateway has stopped."""
+        if order.get('resubmits', 0) >= self.resubmits or not any(thread.is_alive() for thread in self.threads): return False
+        order['reconcile'], order['resubmits'] = True, order.get('resubmits', 0) + 1
+        self.inboxes[self._routes[order['inst']]].put(order)
+        return True
+
+    def _submit(self, order: Dict) -> Dict:
+        route = self._routes.get(order['inst'])
+        if route is None: route = self._routes[order['inst']] = len(self._routes) % len(self.inboxes)
+        self.counts['submitted'] += 1
+        self.inboxes[route].put(order)
+        return order
+
+    def _session(self) -> requests.Session:
+        session = requests.Session()
+        session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0)
+        session.mount('https://', adapter); session.mount('http://', adapter)
+        return session
+
+    def _ping(self, session: requests.Session):
+        """Opens (or keeps open) the worker's connection so an order never pays for TCP/TLS setup."""
+        try: session.get(f"{self.base}/summary", timeout=self.timeout).content
+        except requests.exceptions.RequestException: pass
+
+    def _worker(self, inbox: queue.SimpleQueue):
+        session = self._session()
+        self._ping(session)
+        while True:
+            try: order = inbox.get(timeout=self.keepalive)
+            except queue.Empty: self._ping(session); continue
+            if order is None: break
+            self._execute(session, order)
+            self.completed.append(order)
+
+    def _execute(self, session: requests.Session, order: Dict):
+        url = self.base + order['path']
+        order['status'] = None
+        for attempt in range(self.retries + 1):
+            order['attempts'] = attempt + 1
+            if attempt or order.get('reconcile'):
+                with self._lock: self.counts['retries'] += 1
+                time.sleep(min(0.05 * 2 ** max(attempt - 1 + order.get('resubmits', 0), 0), 1.0))
+                settled = self._reconcile(session, order)  # Did an unanswered earlier attempt go through?
+                if settled: break
+                if settled is None: continue
+                if order.get('reconcile') and order['kind'] == 'open':  # No late market order at a price nobody decided on
+                    order['status'], order['error'] = 'REJECTED', 'NOT_AT_BROKER'; break
+            order['sent'] = time.perf_counter_ns()
+            order.setdefault('first_sent', order['sent'])
+            try: response = session.request(order['method'], url, data=order['body'], timeout=self.timeout)
+            except requests.exceptions.RequestException as e: order['error'] = type(e).__name__; continue
+            if response.status_code >= 500 or response.status_code == 429: order['error'] = f"HTTP {response.status_code}"; continue
+            try: payload = response.json()
+            except ValueError: payload = {}
+            self._settle(order, response.status_code, payload)
+            if order['status']: break
+        if order['status'] is None: order['status'] = 'FAILED'
+        order['acked'] = acked = time.perf_counter_ns()
+        with self._lock:
+            if order['status'] != 'FAILED' or not order.get('reconcile'): self.counts[order['status'].lower()] += 1  # Once per order
+            if 'first_sent' in order:
+                self.latency['queue'].record(order['first_sent'] - order['decided'])
+                self.latency['broker'].record(acked - order['sent'])
+            self.latency['total'].record(acked - order['decided'])
+
+    def _settle(self, order: Dict, status: int, payload: Dict):
+        fill = payload.get('orderFillTransaction')
+        if fill:
+            order['status'], order['fill_price'] = 'FILLED', float(fill['price'])
+            if 'tradeOpened' in fill: order['broker_trade_id'] = fill['tradeOpened']['tradeID']
+        elif order['kind'] == 'close' and status == 404: order['status'] = 'CLOSED'  # Closed broker-side, e.g. by its stop loss
+        else:
+            cancel = payload.get('orderCancelTransaction') or payload.get('orderRejectTransaction') or {}
+            order['error'] = payload.get('errorCode') or cancel.get('reason') or payload.get('errorMessage') or f"HTTP {status}"
+            # A resend whose unanswered predecessor went through: left unsettled, so the next attempt reconciles it
+            if order['error'] != 'CLIENT_TRADE_ID_ALREADY_EXISTS': order['status'] = 'REJECTED'
+
+    def _reconcile(self, session: requests.Session, order: Dict) -> Optional[bool]:
+        """Settles `order` from the broker's view of its trade: True if an earlier attempt took effect,
+        False if it should be sent (again), None if the broker couldn't be asked."""
+        try: response = session.get(f"{self.base}/trades/@{order['trade_client_id']}", timeout=self.timeout)
+        except requests.exceptions.RequestException: return None
+        if response.status_code == 404:
+            if order['kind'] == 'open': return False
+            order['status'] = 'CLOSED'; return True
+        if response.status_code != 200: return None
+        trade = response.json()['trade']
+        if order['kind'] == 'open':
+            order['status'], order['fill_price'], order['broker_trade_id'] = 'FILLED', float(trade['price']), trade['id']
+            return True
+        if trade['state'] != 'OPEN' or abs(float(trade['currentUnits'])) <= order['remaining']:
+            order['status'] = 'FILLED'; return True
+        return False
+
+    def report(self) -> Dict:
+        with self._lock:
+            return {"orders": dict(self.counts), "latency_us": {stage: h.summary() for stage, h in self.latency.items()}}
+
+class MockBroker:
+    """Local stand-in for the OANDA v3 endpoints OrderGateway uses, with injectable latency, 503s and lost acks;
+    the pricing stream serves `stream_lines` once per connection as a chunked body."""
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, lost_ack_rate: float = 0.0,
+                 prices: Optional[Dict[str, float]] = None, seed: int = 0, stream_lines: Iterable[bytes] = ()):
+        self.latency, self.jitter, self.error_rate, self.lost_ack_rate = latency, jitter, error_rate, lost_ack_rate
+        self.prices = prices if prices is not None else {}
+        self.stream_body = b"".join(line + b"\n" for line in stream_lines)
+        self.trades = {}  # client trade ID -> trade
+        self.requests = 0
+        self.server = None
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Serves from a daemon thread and returns the base URL to hand to OrderGateway."""
+        broker = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+            disable_nagle_algorithm = True  # Headers and body go out as separate writes
+            def do_GET(self): broker._handle(self, 'GET')
+            def do_POST(self): broker._handle(self, 'POST')
+            def do_PUT(self): broker._handle(self, 'PUT')
+            def log_message(self, *args): pass
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="mock-broker", daemon=True).start()
+        return f"http://{host}:{self.server.server_address[1]}"
+
+    def stop(self):
+        if self.server: self.server.shutdown(); self.server.server_close()
+
+    def _handle(self, handler: BaseHTTPRequestHandler, method: str):
+        if method == 'GET' and handler.path.partition('?')[0].endswith('/pricing/stream'): return self._stream(handler)
+        body = handler.rfile.read(int(handler.headers.get('Content-Length') or 0))
+        with self._lock:
+            self.requests += 1
+            delay, roll = self.latency + self._rng.random() * self.jitter, self._rng.random()
+        if delay: time.sleep(delay)
+        path = handler.path.split('/v3/accounts/', 1)[-1].partition('/')[2]
+        order_request = method != 'GET'
+        if order_request and roll < self.error_rate: return self._reply(handler, 503, {"errorMessage": "injected error"})
+        with self._lock:
+            if method == 'POST' and path == 'orders': status, payload = self._open(json.loads(body)['order'])
+            elif method == 'PUT' and path.startswith('trades/@') and path.endswith('/close'): status, payload = self._close(path[8:-6], json.loads(body))
+            elif method == 'GET' and path.startswith('trades/@'):
+                trade = self.trades.get(path[8:])
+                status, payload = (200, {"trade": dict(trade)}) if trade else (404, {"errorMessage": "The Trade specified does not exist"})
+            elif method == 'GET' and path == 'summary': status, payload = 200, {"account": {"openTradeCount": sum(t['state'] == 'OPEN' for t in self.trades.values())}}
+            else: status, payload = 404, {"errorMessage": "Not found"}
+        if order_request and roll < self.error_rate + self.lost_ack_rate:
+            handler.close_connection = True; return  # Applied, but the reply never arrives
+        self._reply(handler, status, payload)
+
+    def _open(self, order: Dict) -> Tuple[int, Dict]:
+        trade_id = order['tradeClientExtensions']['id']
+        if trade_id in self.trades: return 400, {"errorCode": "CLIENT_TRADE_ID_ALREADY_EXISTS"}
+        price = self.prices.get(order['instrument'], 1.0)
+        self.trades[trade_id] = trade = {"id": str(len(self.trades) + 1), "instrument": order['instrument'], "price": str(price),
+                                         "initialUnits": order['units'], "currentUnits": order['units'], "state": "OPEN",
+                                         "clientExtensions": {"id": trade_id}}
+        return 201, {"orderFillTransaction": {"price": str(price), "tradeOpened": {"tradeID": trade['id'], "units": order['units']}}}
+
+    def _close(self, trade_id: str, request: Dict) -> Tuple[int, Dict]:
+        trade = self.trades.get(trade_id)
+        if not trade or trade['state'] != 'OPEN': return 404, {"errorCode": "NO_SUCH_TRADE"}
+        current = int(trade['currentUnits'])
+        units = abs(current) if request.get('units', 'ALL') == 'ALL' else min(int(request['units']), abs(current))
+        remaining = current - units if current > 0 else current + units
+        trade['currentUnits'], trade['state'] = str(remaining), 'OPEN' if remaining else 'CLOSED'
+        return 200, {"orderFillTransaction": {"price": str(self.prices.get(trade['instrument'], 1.0)), "units": str(-units if current > 0 else units)}}
+
+    def _stream(self, handler: BaseHTTPRequestHandler, chunk: int = 65536):
+        body = self.stream_body
+        handler.send_response(200); handler.send_header('Content-Type', 'application/octet-stream')
+        handler.send_header('Transfer-Encoding', 'chunked'); handler.end_headers()
+        for pos in range(0, len(body), chunk): handler.wfile.write(b"%x\r\n%s\r\n" % (len(body[pos:pos + chunk]), body[pos:pos + chunk]))
+        handler.wfile.write(b"0\r\n\r\n")
+        handler.close_connection = True  # The stream has ended
+
+    @staticmethod
+    def _reply(handler: BaseHTTPRequestHandler, status: int, payload: Dict):
+        body = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json'); handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers(); handler.wfile.write(body)
+
+# ==============================================================================
+#  MULTI-TIMEFRAME CANDLE AGGREGATION (integer epoch buckets, one pass per tick)
+# ==============================================================================
+TIMEFRAME_SECONDS = {'M1': 60, 'M5': 300, 'M15': 900, 'H1': 3600, 'H4': 14400, 'D1': 86400}
+
+_RFC3339_MINUTES = {}
+
+def parse_rfc3339(ts: str) -> float:
+    """Epoch seconds for an OANDA timestamp such as '2024-06-21T12:34:56.123456789Z', truncated to microseconds like fromisoformat."""
+    if ts[16:17] != ':' or ts[-1:] != 'Z': return datetime.fromisoformat(ts.replace('Z', '+00:00')).timestamp()
+    base = _RFC3339_MINUTES.get(ts[:16])
+    if base is None:
+        if len(_RFC3339_MINUTES) > 4096: _RFC3339_MINUTES.clear()
+        base = _RFC3339_MINUTES[ts[:16]] = datetime.fromisoformat(ts[:16] + ':00+00:00').timestamp()
+    return base + float(ts[17:-1][:9])  # 'SS.ffffff': beyond microseconds, 59.999999999 would round up to the next minute
+
+class CandleAggregator:
+    """OHLC candles of one instrument for any set of TIMEFRAME_SECONDS timeframes; closed candles go to every subscriber as
+    (instrument, timeframe, candle), shortest timeframe first."""
+    def __init__(self, instrument: str, timeframes: Iterable[str]):
+        self.instrument = instrument
+        self.timeframes = sorted(timeframes, key=TIMEFRAME_SECONDS.__getitem__)
+        self.seconds = [TIMEFRAME_SECONDS[tf] for tf in self.timeframes]
+        n = len(self.timeframes)
+        self.starts = [-1] * n
+        self.opens, self.highs, self.lows, self.closes = [0.0] * n, [0.0] * n, [0.0] * n, [0.0] * n
+        self.subscribers = []
+        self._slots = range(n)
+
+    def subscribe(self, callback: Callable[[str, str, Dict], None]):
+        self.subscribers.append(callback)
+
+    def update(self, price: float, ts: int):
+        starts, seconds, highs, lows, closes = self.starts, self.seconds, self.highs, self.lows, self.closes
+        for i in self._slots:
+            bucket = ts - ts % seconds[i]
+            if bucket > starts[i]:
+                if starts[i] >= 0: self._emit(i)
+                starts[i] = bucket
+                self.opens[i] = highs[i] = lows[i] = closes[i] = price
+            else:
+                if price > highs[i]: highs[i] = price
+                elif price < lows[i]: lows[i] = price
+                closes[i] = price
+
+    def _emit(self, i: int):
+        candle = {"time": self.starts[i], "open": self.opens[i], "high": self.highs[i], "low": self.lows[i], "close": self.closes[i], "volume": 0}
+        for callback in self.subscribers: callback(self.instrument, self.timeframes[i], candle)
+
+    def current(self, timeframe: str) -> Optional[Dict]:
+        i = self.timeframes.index(timeframe)
+        if self.starts[i] < 0: return None
+        return {"time": self.starts[i], "open": self.opens[i], "high": self.highs[i], "low": self.lows[i], "close": self.closes[i]}
+
+    def restore(self, timeframe: str, candle: Optional[Dict]):
+        i = self.timeframes.index(timeframe)
+        if not candle: self.starts[i] = -1; return
+        self.starts[i] = candle['time']
+        self.opens[i], self.highs[i], self.lows[i], self.closes[i] = candle['open'], candle['high'], candle['low'], candle['close']
+
+    def discard_closed(self, timeframe: str, last_closed_time: int):
+        """Drops an in-progress candle that history shows has already closed."""
+        i = self.timeframes.index(timeframe)
+        if 0 <= self.starts[i] <= last_closed_time: self.starts[i] = -1
+
+# ==============================================================================
+#  CRASH-SAFE STATE JOURNAL (append-only events + periodic compact snapshots)
+# ==============================================================================
+class StateJournal:
+    """Append-only JSON-lines journal of state changes, fsynced by a writer thread, with periodic snapshots that truncate it."""
+    def __init__(self, directory: str = STATE_DIR, flush_interval: float = JOURNAL_FLUSH_INTERVAL_S):
+        os.makedirs(directory, exist_ok=True)
+        self.journal_path = os.path.join(directory, 'journal.log')
+        self.snapshot_path = os.path.join(directory, 'snapshot.json')
+        self.flush_interval = flush_interval
+        self.seq = 0
+        self._queue = queue.SimpleQueue()
+        self._writer = None
+
+    def recover(self) -> Tuple[Optional[Dict], List[Tuple[int, str, Dict]]]:
+        """Latest snapshot (or None) and the journal records written after it, oldest first."""
+        snapshot, snapshot_seq, records = None, 0, []
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as f: snapshot = json.load(f)
+            snapshot_seq = snapshot['seq']
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'rb') as f:
+                for line in f:
+                    try: seq, kind, fields = json.loads(line)
+                    except ValueError: break  # Torn tail from a crash mid-write
+                    if seq > snapshot_seq: records.append((seq, kind, fields))
+        self.seq = max([snapshot_seq] + [r[0] for r in records])
+        return snapshot, records
+
+    def start(self):
+        self._writer = threading.Thread(target=self._run, name="journal", daemon=True)
+        self._writer.start()
+
+    def record(self, kind: str, **fields):
+        self.seq += 1
+        self._queue.put((self.seq, kind, fields))
+
+    def snapshot(self, state: Dict):
+        self._queue.put((self.seq, 'snapshot', state))
+
+    def close(self):
+        if self._writer:
+            self._queue.put(None); self._writer.join(); self._writer = None
+
+    def _run(self):
+        journal = open(self.journal_path, 'a', encoding='utf-8')
+        try:
+            while True:
+                items = [self._queue.get()]
+                deadline = time.monotonic() + self.flush_interval
+                while items[-1] is not None:
+                    try: items.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                    except queue.Empty: break
+                lines = []
+                for item in items:
+                    if item is None: break
+                    seq, kind, fields = item
+                    if kind != 'snapshot':
+                        lines.append(json.dumps([seq, kind, fields], separators=(',', ':')) + "\n"); continue
+                    journal.write("".join(lines)); lines = []
+                    journal.flush(); os.fsync(journal.fileno())
+                    tmp_path = self.snapshot_path + '.tmp'
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        f.write(json.dumps(dict(fields, seq=seq), separators=(',', ':'))); f.flush(); os.fsync(f.fileno())  # dumps uses the C encoder
+                    os.replace(tmp_path, self.snapshot_path)
+                    journal.seek(0); journal.truncate()
+                if lines:
+                    journal.write("".join(lines)); journal.flush(); os.fsync(journal.fileno())
+                if items[-1] is None: return
+        finally:
+            journal.close()
+
+# ==============================================================================
+#  BINARY TICK RECORDER (fixed-width rotating files + zero-copy mmap reader)
+# ==============================================================================
+# 32-byte records; files are named by the first tick's epoch-ns and each has a sparse
+# .idx sidecar holding the timestamp of every TICK_INDEX_STRIDE-th record.
+TICK_RECORD_DTYPE = np.dtype([('ts_ns', '<i8'), ('bid', '<f8'), ('ask', '<f8'), ('inst', '<u4'), ('pad', '<u4')])
+TICK_INDEX_STRIDE = 4096
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+def datetime_to_ns(timestamp: datetime) -> int:
+    return (timestamp - _EPOCH) // _MICROSECOND * 1000
+
+class TickRecorder:
+    """Appends ticks as time-sorted TICK_RECORD_DTYPE records to rotating files, flushed by a background thread
+    every `flush_interval` seconds."""
+    def __init__(self, directory: str = TICK_DIR, flush_interval: float = 0.5, file_records: int = TICK_FILE_RECORDS,
+                 reorder_window: float = TICK_REORDER_S):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.reorder_ns = int(reorder_window * 1e9)
+        self.file_records = file_records
+        self.instrument_ids = load_instrument_ids(directory)
+        self._pending = deque()
+        self._wake = threading.Event()
+        self._closing = False
+        self._writer = threading.Thread(target=self._run, name="tick-recorder", daemon=True)
+        self._writer.start()
+
+    def _instrument_id(self, inst: str) -> int:
+        inst_id = self.instrument_ids.get(inst)
+        if inst_id is None:
+            inst_id = self.instrument_ids[inst] = len(self.instrument_ids)
+            with open(os.path.join(self.directory, 'instruments.json.tmp'), 'w') as f: json.dump(self.instrument_ids, f)
+            os.replace(os.path.join(self.directory, 'instruments.json.tmp'), os.path.join(self.directory, 'instruments.json'))
+        return inst_id
+
+    def record(self, inst: str, ts_ns: int, bid: float, ask: float):
+        self._pending.append((ts_ns, bid, ask, self._instrument_id(inst), 0))
+
+    def flush(self):
+        """Wakes the writer now instead of at the next interval."""
+        self._wake.set()
+
+    def close(self):
+        self._closing = True; self._wake.set(); self._writer.join()
+
+    def _run(self):
+        data = index = None
+        written, last_ns, pending = 0, None, self._pending
+        held = np.empty(0, dtype=TICK_RECORD_DTYPE)
+        try:
+            while True:
+                self._wake.wait(self.flush_interval); self._wake.clear()
+                closing = self._closing  # Read before draining, so everything recorded before close() gets written
+                batch = [pending.popleft() for _ in range(len(pending))]
+                if not batch and not len(held):
+                    if closing: return
+                    continue
+                records = np.concatenate((held, np.array(batch, dtype=TICK_RECORD_DTYPE)))
+                if (np.diff(records['ts_ns']) < 0).any():  # Instruments' timestamps can interleave slightly out of order
+                    records = records[np.argsort(records['ts_ns'], kind='stable')]
+                if batch and not closing:  # The newest ticks wait for a later flush unless nothing new arrived
+                    cut = int(np.searchsorted(records['ts_ns'], records['ts_ns'][-1] - self.reorder_ns, side='right'))
+                    records, held = records[:cut], records[cut:]
+                else: held = records[:0]
+                if last_ns is not None and len(records) and records['ts_ns'][0] < last_ns:
+                    records['ts_ns'] = np.maximum(records['ts_ns'], last_ns)  # Later than the window: clamped, never written out of order
+                if len(records): last_ns = int(records['ts_ns'][-1])
+                while len(records):
+                    if data is None or written >= self.file_records:
+                        if data: data.close(); index.close()
+                        path = os.path.join(self.directory, f"ticks-{int(records['ts_ns'][0]):020d}.bin")
+                        data, index, written = open(path, 'ab'), open(path[:-4] + '.idx', 'ab'), 0
+                    part = records[:self.file_records - written]
+                    records = records[len(part):]
+                    first_indexed = -written % TICK_INDEX_STRIDE
+                    index.write(part['ts_ns'][first_indexed::TICK_INDEX_STRIDE].tobytes())
+                    data.write(part.tobytes())
+                    written += len(part)
+                if data: data.flush(); index.flush()
+                if closing: return
+        finally:
+            if data: data.close(); index.close()
+
+def load_instrument_ids(directory: str) -> Dict[str, int]:
+    path = os.path.join(directory, 'instruments.json')
+    if not os.path.exists(path): return {}
+    with open(path) as f: return json.load(f)
+
+class TickReader:
+    """Memory-maps a TickRecorder directory and serves zero-copy NumPy views with time-range seeking
+    (files are sorted by time, which the index and binary search rely on)."""
+    def __init__(self, directory: str = TICK_DIR):
+        self.directory = directory
+        self.instrument_ids = load_instrument_ids(directory)
+        self.instrument_names = {v: k for k, v in self.instrument_ids.items()}
+
+    def _files(self) -> List[Tuple[np.ndarray, np.ndarray]]:
+        files = []
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith('ticks-') and name.endswith('.bin')): continue
+            path = os.path.join(self.directory, name)
+            records = os.path.getsize(path) // TICK_RECORD_DTYPE.itemsize
+            if not records: continue
+            data = np.memmap(path, dtype=TICK_RECORD_DTYPE, mode='r', shape=(records,))
+            idx_path, idx = path[:-4] + '.idx', np.empty(0, dtype='<i8')
+            idx_entries = min(os.path.getsize(idx_path) // 8 if os.path.exists(idx_path) else 0, -(-records // TICK_INDEX_STRIDE))
+            if idx_entries: idx = np.memmap(idx_path, dtype='<i8', mode='r', shape=(idx_entries,))
+            files.append((data, idx))
+        return files
+
+    def _seek(self, data: np.ndarray, idx: np.ndarray, ts_ns: int) -> int:
+        """Position of the first record at or after ts_ns."""
+        block = max(int(np.searchsorted(idx, ts_ns, side='left')) - 1, 0)
+        lo = block * TICK_INDEX_STRIDE
+        hi = (block + 2) * TICK_INDEX_STRIDE if block + 1 < len(idx) else len(data)
+        return lo + int(np.searchsorted(data['ts_ns'][lo:hi], ts_ns, side='left'))
+
+    def read(self, start_ns: Optional[int] = None, end_ns: Optional[int] = None) -> Iterator[np.ndarray]:
+        """Yields zero-copy structured views of the records in [start_ns, end_ns), one per file."""
+        for data, idx in self._files():
+            if end_ns is not None and data['ts_ns'][0] >= end_ns: break
+            if start_ns is not None and data['ts_ns'][-1] < start_ns: continue
+            lo = self._seek(data, idx, start_ns) if start_ns is not None else 0
+            hi = self._seek(data, idx, end_ns) if end_ns is not None else len(data)
+            if hi > lo: yield data[lo:hi]
+
+    def iter_ticks(self, start_ns: Optional[int] = None, end_ns: Optional[int] = None) -> Iterator[Tuple[str, float, float, float]]:
+        """(instrument, epoch_seconds, bid, ask) tuples, ready for ReplayTrader.run."""
+        names = self.instrument_names
+        for view in self.read(start_ns, end_ns):
+            for i in range(0, len(view), 65536):
+                chunk = view[i:i + 65536]
+                yield from zip(map(names.__getitem__, chunk['inst'].tolist()), (chunk['ts_ns'] / 1e9).tolist(), chunk['bid'].tolist(), chunk['ask'].tolist())
+
+    def to_arrays(self, start_ns: Optional[int] = None, end_ns: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Per-instrument TICK_DTYPE arrays, as run_sweep expects."""
+        views = list(self.read(start_ns, end_ns))
+        if not views: return {}
+        records = np.concatenate(views)
+        arrays = {}
+        for inst_id, inst in self.instrument_names.items():
+            rows = records[records['inst'] == inst_id]
+            if not len(rows): continue
+            arr = np.empty(len(rows), dtype=TICK_DTYPE)
+            arr['time'], arr['bid'], arr['ask'] = rows['ts_ns'] / 1e9, rows['bid'], rows['ask']
+            arrays[inst] = arr
+        return arrays
 
 # ==============================================================================
 #  LIVE OANDA TRADING BOT ENGINE
 # ==============================================================================
 class LiveOandaTrader:
-    def __init__(self, instruments: str):
+    def __init__(self, instruments: Union[str, List[str]], smc_params: Optional[Dict] = None, risk_per_trade_usd: float = RISK_PER_TRADE_USD,
+                 headless: bool = HEADLESS, timeframes: Iterable[str] = TIMEFRAMES, max_positions: int = MAX_POSITIONS_PER_INSTRUMENT,
+                 partial_take_profits: Iterable[Tuple[float, float]] = PARTIAL_TAKE_PROFITS):
         self.domain = 'stream-fxpractice.oanda.com' if ENVIRONMENT == 'practice' else 'stream-fxtrade.oanda.com'
         self.url = f'https://{self.domain}/v3/accounts/{ACCOUNT_ID}/pricing/stream'
+        self.api_url = 'https://api-fxpractice.oanda.com' if ENVIRONMENT == 'practice' else 'https://api-fxtrade.oanda.com'
         self.headers = {'Authorization': f'Bearer {ACCESS_TOKEN}'}
-        self.params = {'instruments': instruments}
-        self.instrument_list = instruments.split(',')
+        self.instrument_list = resolve_instruments(instruments) if isinstance(instruments, str) else list(instruments)
+        self.params = {'instruments': ",".join(self.instrument_list)}
+        self.pip_sizes = {inst: pip_size(inst) for inst in self.instrument_list}
         self.dashboard = Dashboard()
+        self.headless = headless
+        self.ticks_processed = 0
         self.start_time = time.time()
         self.logs = []
         self.state = {
@@ -229,39 +1605,157 @@ class LiveOandaTrader:
             'instruments': {inst: {
                 'price': 0.0, 'bid': 0.0, 'ask': 0.0, 'spread': 0.0,
                 'analysis_status': 'Connecting...', 'h1_candles_count': 0, 'h4_candles_count': 0,
-                'spinner': ' ', 'active_trade': None
+                'spinner': ' ', 'positions': None, 'live_pnl_usd': 0.0
             } for inst in self.instrument_list},
             'logs': self.logs
         }
-        self.smc_bots = {inst: SMCBot(inst) for inst in self.instrument_list}
-        self.h1_candles = {inst: [] for inst in self.instrument_list}
-        self.h4_candles = {inst: [] for inst in self.instrument_list}
-        self.current_h1_candle = {inst: None for inst in self.instrument_list}
-        self.current_h4_candle = {inst: None for inst in self.instrument_list}
+        self.risk_per_trade_usd = risk_per_trade_usd
+        # --- Open positions: one PositionBook per instrument, its dict shared with the dashboard state ---
+        self.max_positions = max_positions
+        self.partial_take_profits = tuple(partial_take_profits)
+        self.books = {inst: PositionBook() for inst in self.instrument_list}
+        for inst, book in self.books.items(): self.state['instruments'][inst]['positions'] = book.positions
+        self.smc_bots = {inst: SMC_ENGINES[SMC_ENGINE](inst, **(smc_params or {})) for inst in self.instrument_list}
+        # --- Closed candles per timeframe; SMCBot reads the H1/H4 ones ---
+        self.timeframes = tuple(dict.fromkeys(('H1', 'H4') + tuple(timeframes)))
+        self.candles = {tf: {inst: [] for inst in self.instrument_list} for tf in self.timeframes}
+        self.h1_candles = self.candles['H1']
+        self.h4_candles = self.candles['H4']
+        self.aggregators = {inst: CandleAggregator(inst, self.timeframes) for inst in self.instrument_list}
+        for aggregator in self.aggregators.values():
+            aggregator.subscribe(self._store_closed_candle)
+            aggregator.subscribe(self._analyze_on_close)
+        self.journal = None
+        self._next_snapshot_at = None
+        self.recorder = None
+        self.monitor = None
+        self.gateway = None
+
+    def enable_gateway(self, gateway: OrderGateway):
+        """Sends every later open and close to the broker through `gateway` (positions are still tracked locally)."""
+        self.gateway = gateway
+        gateway.start()
+        self._add_log(f"📡 Order execution on: {len(gateway.inboxes)} keep-alive connection(s) to {gateway.base.split('/v3/')[0]}")
+
+    def enable_journal(self, journal: StateJournal):
+        """Restores state from the journal's snapshot and tail, then journals every later change."""
+        started = time.perf_counter()
+        snapshot, records = journal.recover()
+        if snapshot: self._restore_snapshot(snapshot)
+        for _, kind, fields in records: self._apply_journal_record(kind, fields)
+        for inst in self.instrument_list:
+            for tf in self.timeframes:
+                # An in-progress candle from the snapshot that has since been journaled as closed is stale.
+                if self.candles[tf][inst]: self.aggregators[inst].discard_closed(tf, self.candles[tf][inst][-1]['time'])
+            self.state['instruments'][inst]['h1_candles_count'] = len(self.h1_candles[inst])
+            self.state['instruments'][inst]['h4_candles_count'] = len(self.h4_candles[inst])
+        if snapshot or records:
+            self._add_log(f"💾 Recovered state: snapshot + {len(records)} journal records in {(time.perf_counter() - started) * 1000:.1f} ms")
+        self.journal = journal
+        journal.start()
+
+    def _journal_snapshot(self, ts: float):
+        self._next_snapshot_at = ts + SNAPSHOT_INTERVAL_S
+        self.journal.snapshot({'instruments': {inst: {
+            'candles': {tf: list(self.candles[tf][inst]) for tf in self.timeframes},
+            'current_candles': {tf: self.aggregators[inst].current(tf) for tf in self.timeframes},
+            'positions': [PositionBook.record(p) for p in self.books[inst].positions.values()], 'next_position_id': self.books[inst]._next_id,
+            'mitigated_h1_pois': list(self.smc_bots[inst].mitigated_h1_pois), 'mitigated_h4_pois': list(self.smc_bots[inst].mitigated_h4_pois),
+        } for inst in self.instrument_list}})
+
+    def _restore_snapshot(self, snapshot: Dict):
+        for inst, saved in snapshot['instruments'].items():
+            if inst not in self.state['instruments']: continue
+            for tf in self.timeframes:
+                if tf not in saved['candles']: continue
+                self.candles[tf][inst] = saved['candles'][tf]
+                self.aggregators[inst].restore(tf, saved['current_candles'].get(tf))
+            self.books[inst].clear()
+            # Snapshots from before PositionBook hold a single 'active_trade'
+            for position in saved.get('positions', [saved['active_trade']] if saved.get('active_trade') else []): self.books[inst].add(position)
+            self.books[inst]._next_id = max(self.books[inst]._next_id, saved.get('next_position_id', 1))
+            self.smc_bots[inst].mitigated_h1_pois = set(saved['mitigated_h1_pois'])
+            self.smc_bots[inst].mitigated_h4_pois = set(saved['mitigated_h4_pois'])
+
+    def _apply_journal_record(self, kind: str, fields: Dict):
+        inst = fields['inst']
+        if inst not in self.state['instruments']: return
+        if kind == 'candle':
+            if fields['tf'] not in self.candles: return
+            candles = self.candles[fields['tf']][inst]
+            if not candles or fields['candle']['time'] > candles[-1]['time']: candles.append(fields['candle'])
+        elif kind == 'open': self.books[inst].add(fields['trade'])
+        elif kind == 'close':
+            book = self.books[inst]
+            if 'id' not in fields: book.clear()  # Pre-PositionBook record: the one open trade closed
+            elif fields['id'] in book.positions: book.close(fields['id'], fields['units'], fields['price'], fields['level'])
+        elif kind == 'pois':
+            self.smc_bots[inst].mitigated_h1_pois = set(fields['h1'])
+            self.smc_bots[inst].mitigated_h4_pois = set(fields['h4'])
+
+    def _journal_pois(self, inst: str, before: Tuple[frozenset, frozenset]):
+        bot = self.smc_bots[inst]
+        if before != (frozenset(bot.mitigated_h1_pois), frozenset(bot.mitigated_h4_pois)):
+            self.journal.record('pois', inst=inst, h1=list(bot.mitigated_h1_pois), h4=list(bot.mitigated_h4_pois))
+
+    def warm_start(self, starter: Optional[WarmStarter] = None):
+        """Fills h1_candles/h4_candles from history so analysis can start on the first H1 close."""
+        starter = starter or WarmStarter(self.api_url, self.headers, CandleCache())
+        self.state['connection_status'] = 'Warm start...'
+        jobs = [(inst, granularity) for inst in self.instrument_list for granularity in ('H1', 'H4')]
+        if not jobs: return
+        with ThreadPoolExecutor(max_workers=min(len(jobs), starter.workers)) as pool:
+            futures = {job: pool.submit(starter.load, *job, self._add_log) for job in jobs}
+        for (inst, granularity), future in futures.items():
+            try: candles = future.result()
+            except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                self._add_log(f"Warm start failed for {inst} {granularity}: {e}"); continue
+            closed = self.candles[granularity]
+            if closed[inst]:  # Keep recovered history; only append what closed while we were down
+                candles = closed[inst] + [c for c in candles if c['time'] > closed[inst][-1]['time']]
+            closed[inst] = candles
+            if candles: self.aggregators[inst].discard_closed(granularity, candles[-1]['time'])
+            self.state['instruments'][inst][f"{granularity.lower()}_candles_count"] = len(candles)
+        for inst in self.instrument_list:
+            self._add_log(f"🔥 [{inst}] Warm start: {len(self.h1_candles[inst])} 1H / {len(self.h4_candles[inst])} 4H candles")
+
+    def snapshot(self) -> Dict:
+        """Copy of the dashboard state that a render thread can read while ticks keep mutating the original."""
+        uptime_seconds = int(time.time() - self.start_time)
+        self.state['uptime'] = f"{uptime_seconds//3600}h {(uptime_seconds%3600)//60}m {uptime_seconds%60}s"
+        instruments = {}
+        for inst, data in self.state['instruments'].items():
+            data = dict(data)
+            data['positions'] = [dict(p, live_pnl_usd=PositionBook.pnl(p, data['bid'], data['ask'])) for p in list(data['positions'].values())]
+            instruments[inst] = data
+        return {'connection_status': self.state['connection_status'], 'uptime': self.state['uptime'],
+                'max_risk_usd': self.risk_per_trade_usd, 'instruments': instruments, 'logs': self.logs[-5:],
+                'latency': self.monitor.report() if self.monitor else None}
 
     def _add_log(self, message: str):
         self.logs.append(f"[{datetime.now(timezone.utc).strftime('%H:%M:%S')}] {message}")
 
-    def _update_candle(self, candle: Optional[Dict], price: float) -> Dict:
-        if not candle: return {'open': price, 'high': price, 'low': price, 'close': price, 'start_time': None}
-        candle['high'] = max(candle['high'], price)
-        candle['low'] = min(candle['low'], price)
-        candle['close'] = price
-        return candle
+    def _mid_price(self, inst: str) -> Optional[float]:
+        data = self.state['instruments'].get(inst)
+        return data['price'] if data else None
 
     def _calculate_units(self, inst: str, stop_loss_pips: float) -> int:
         """Calculates position size to risk a fixed USD amount."""
         if stop_loss_pips <= 0: return 0
         
-        # For XAU_USD and BTC_USD, the value of 1 pip for 1 unit is simply 0.01 (since they are quoted in USD)
-        # For other pairs, more complex conversion logic would be needed.
-        pip_value_for_one_unit = 0.01 
+        # For XAU_USD and BTC_USD, the value of 1 pip for 1 unit is pinned at 0.01 (INSTRUMENT_PIPS);
+        # other pairs convert the pip from their quote currency using the latest USD cross rate.
+        pip_value_for_one_unit = pip_value_usd(inst, self._mid_price)
+        if not pip_value_for_one_unit:
+            quote = inst.partition('_')[2]
+            self._add_log(f"⚠️ [{inst}] Trade skipped: no {quote}_USD or USD_{quote} price yet to size it in USD")
+            return 0
 
         risk_in_usd_per_unit = stop_loss_pips * pip_value_for_one_unit
         
         if risk_in_usd_per_unit <= 0: return 0
         
-        return int(RISK_PER_TRADE_USD / risk_in_usd_per_unit)
+        return int(self.risk_per_trade_usd / risk_in_usd_per_unit)
 
     def _handle_tick(self, tick: Dict):
         try:
@@ -271,123 +1765,990 @@ class LiveOandaTrader:
             
             bid = float(tick['bids'][0]['price'])
             ask = float(tick['asks'][0]['price'])
-            mid_price = (bid + ask) / 2
-            
-            # Pip calculation for BTC/XAU is based on price, not fixed value
-            pips_multiplier = 1 if 'BTC' in inst or 'XAU' in inst else 10000 
-            spread = (ask - bid) * pips_multiplier
-
-            # Update dashboard state
-            self.state['instruments'][inst]['price'] = mid_price
-            self.state['instruments'][inst]['bid'] = bid
-            self.state['instruments'][inst]['ask'] = ask
-            self.state['instruments'][inst]['spread'] = spread
-            self.state['instruments'][inst]['spinner'] = self.dashboard.get_spinner()
-            
-            if self.state['instruments'][inst]['active_trade']: self._track_active_trade(inst)
-            self._aggregate_candles(inst, mid_price, datetime.fromisoformat(tick['time'].replace('Z', '+00:00')))
+            ts = parse_rfc3339(tick['time'])
+            if self.recorder: self.recorder.record(inst, int(ts * 1e9), bid, ask)
+            self._process_price(inst, bid, ask, ts)
         except (KeyError, IndexError): pass
 
-    def _track_active_trade(self, inst: str):
-        trade = self.state['instruments'][inst]['active_trade']
+    def _process_burst(self, inst: str, ticks: List[Tuple[float, float, float]]):
+        """Coalesced ticks for one instrument: candles and any open trade see every tick, the display only the latest."""
+        data = self.state['instruments'][inst]
+        if self.monitor: self.monitor.ticks[inst] += len(ticks) - 1
+        for bid, ask, ts in ticks[:-1]:
+            data['bid'] = bid; data['ask'] = ask
+            if data['positions']: self._track_positions(inst)
+            self._aggregate_candles(inst, (bid + ask) / 2, ts)
+        self._process_price(inst, *ticks[-1])
+
+    def _end_batch(self):
+        """Called by stream_async() after every network read's bursts have been processed."""
+        if self.gateway and self.gateway.completed: self._apply_order_results()
+
+    def _apply_order_results(self):
+        """Logs the gateway's finished orders, drops positions whose open the broker rejected and
+        queues orders whose outcome is unknown (FAILED) to be reconciled again."""
+        completed = self.gateway.completed
+        while completed:
+            order = completed.popleft()
+            inst, status, position_id = order['inst'], order['status'], order['position_id']
+            took = f"{(order['acked'] - order['decided']) / 1e6:.1f} ms, {order['attempts']} attempt(s)"
+            if status == 'FILLED':
+                price = f" @ {order['fill_price']:.{price_decimals(inst)}f}" if 'fill_price' in order else ""
+                self._add_log(f"📨 [{inst}] {order['kind'].upper()} #{position_id} filled{price} ({took})")
+            elif status == 'CLOSED': self._add_log(f"📨 [{inst}] #{position_id} was already closed at the broker ({took})")
+            elif status == 'FAILED':  # Outcome unknown; a position closed since then had its trade settled by that close
+                position = self.books[inst].positions.get(position_id)
+                if (order['kind'] == 'close' or position) and self.gateway.resubmit(order):
+                    if order['resubmits'] == 1: self._add_log(f"⚠️ [{inst}] {order['kind'].upper()} #{position_id} unconfirmed: {order.get('error')} — reconciling ({took})")
+                    continue
+                if position and order['kind'] == 'open': position['unconfirmed'] = True  # Kept: its close addresses the trade either way
+                self._add_log(f"⚠️ [{inst}] {order['kind'].upper()} #{position_id} still unconfirmed after {order.get('resubmits', 0)} reconcile(s): "
+                              f"{order.get('error')} — check the broker position ({took})")
+            elif order['kind'] == 'open':
+                self._add_log(f"❌ [{inst}] OPEN #{position_id} {status.lower()}: {order.get('error')} ({took})")
+                self._drop_unfilled(inst, position_id, status)
+            else: self._add_log(f"⚠️ [{inst}] CLOSE #{position_id} {status.lower()}: {order.get('error')} — check the broker position ({took})")
+
+    def _drop_unfilled(self, inst: str, position_id: int, status: str):
+        """Forgets a position whose open the broker never filled, closing it at its entry price (no P/L)."""
+        book = self.books[inst]
+        if position_id not in book.positions: return
+        units, entry = book.positions[position_id]['units'], book.positions[position_id]['entry_price_with_spread']
+        book.close(position_id, units, entry)
+        if self.journal: self.journal.record('close', inst=inst, id=position_id, units=units, price=entry, reason="ORDER " + status, level=None)
+
+    def _process_price(self, inst: str, bid: float, ask: float, ts: float):
+        monitor, started = self.monitor, 0
+        if monitor:
+            monitor.ticks[inst] += 1
+            monitor.countdown -= 1
+            if not monitor.countdown: started = monitor.sample(inst, ts)
+        mid_price = (bid + ask) / 2
+        
+        # Spread in pips (BTC/XAU pips are whole price units, see INSTRUMENT_PIPS)
+        spread = (ask - bid) / self.pip_sizes[inst]
+
+        # Update dashboard state
+        self.state['instruments'][inst]['price'] = mid_price
+        self.state['instruments'][inst]['bid'] = bid
+        self.state['instruments'][inst]['ask'] = ask
+        self.state['instruments'][inst]['spread'] = spread
+        self.state['instruments'][inst]['spinner'] = self.dashboard.get_spinner()
+        
+        if not started:
+            if self.state['instruments'][inst]['positions']: self._track_positions(inst)
+            self._aggregate_candles(inst, mid_price, ts)
+        else:
+            if self.state['instruments'][inst]['positions']:
+                mark = time.perf_counter_ns(); self._track_positions(inst); monitor.record('track_trade', time.perf_counter_ns() - mark)
+            mark = time.perf_counter_ns(); self._aggregate_candles(inst, mid_price, ts); monitor.record('aggregate', time.perf_counter_ns() - mark)
+        if self.journal and (self._next_snapshot_at is None or ts >= self._next_snapshot_at): self._journal_snapshot(ts)
+        if started: monitor.record('process_price', time.perf_counter_ns() - started)
+
+    def _track_positions(self, inst: str):
+        data, book = self.state['instruments'][inst], self.books[inst]
+        bid, ask = data['bid'], data['ask']
+        # Only positions whose SL/TP this quote crossed are touched; P/L comes from the book's running totals.
+        for position_id, price, reason, units, level in book.triggered(bid, ask):
+            self._close_trade(inst, position_id, price, reason, units, level)
+        data['live_pnl_usd'] = book.unrealized(bid, ask)
+
+    def _take_profit_levels(self, res: Dict) -> List[List]:
+        """[price, units] take-profits: one per PARTIAL_TAKE_PROFITS entry, then the rest of the units at res['tp']."""
+        entry, units, levels = res['entry_price_with_spread'], res['units'], []
+        for distance, fraction in self.partial_take_profits:
+            level_units = min(int(units * fraction), units - sum(u for _, u in levels))
+            if level_units > 0: levels.append([entry + (res['tp'] - entry) * distance, level_units])
+        remaining = units - sum(u for _, u in levels)
+        return levels + [[res['tp'], remaining]] if remaining > 0 else levels
+
+    def _open_trade(self, inst: str, res: Dict):
+        # --- SPREAD-AWARE TRADE EXECUTION ---
         bid = self.state['instruments'][inst]['bid']
         ask = self.state['instruments'][inst]['ask']
         
-        pnl_usd = 0.0
-        if trade['order_type'] == 'BUY':
-            # If we bought, we close the trade by selling at the current 'bid' price.
-            price_change = bid - trade['entry_price_with_spread']
-            pnl_usd = price_change * trade['units']
-            if bid <= trade['sl']: self._close_trade(inst, bid, "STOP LOSS")
-            elif bid >= trade['tp']: self._close_trade(inst, bid, "TAKE PROFIT")
+        if res['order_type'] == 'BUY':
+            res['entry_price_with_spread'] = ask # We buy at the ask price
+            stop_pips = (ask - res['sl']) / self.pip_sizes[inst]
+            res['units'] = self._calculate_units(inst, stop_pips)
         else: # SELL
-            # If we sold, we close the trade by buying at the current 'ask' price.
-            price_change = trade['entry_price_with_spread'] - ask
-            pnl_usd = price_change * trade['units']
-            if ask >= trade['sl']: self._close_trade(inst, ask, "STOP LOSS")
-            elif ask <= trade['tp']: self._close_trade(inst, ask, "TAKE PROFIT")
-        
-        if self.state['instruments'][inst]['active_trade']:
-            self.state['instruments'][inst]['active_trade']['live_pnl_usd'] = pnl_usd
+            res['entry_price_with_spread'] = bid # We sell at the bid price
+            stop_pips = (res['sl'] - bid) / self.pip_sizes[inst]
+            res['units'] = self._calculate_units(inst, stop_pips)
 
-    def _close_trade(self, inst: str, price: float, reason: str):
-         self._add_log(f"🎯 [{inst}] {reason} HIT AT {price:.2f}")
-         self.state['instruments'][inst]['active_trade'] = None
+        if res['units'] > 0:
+            res['tp_levels'] = self._take_profit_levels(res)
+            self.books[inst].add(res)
+            if self.gateway: self.gateway.submit_open(inst, res)
+            if self.journal: self.journal.record('open', inst=inst, trade=PositionBook.record(res))
+            lots = res.get('units', 0) / 100000.0
+            self._add_log(f"🚨 [{inst}] TAKE TRADE: {res['order_type']} {lots:.2f} lots @ {res['entry_price_with_spread']:.{price_decimals(inst)}f}")
 
-    def _aggregate_candles(self, inst: str, price: float, timestamp: datetime):
-        h1_start = timestamp.replace(minute=0, second=0, microsecond=0)
-        
-        if self.current_h1_candle[inst] is None: self.current_h1_candle[inst] = self._update_candle(None, price); self.current_h1_candle[inst]['start_time'] = h1_start
-        if h1_start > self.current_h1_candle[inst]['start_time']:
-            c = self.current_h1_candle[inst]
-            self.h1_candles[inst].append({"time": int(c['start_time'].timestamp()), "open":c['open'],"high":c['high'],"low":c['low'],"close":c['close'],"volume":0})
-            self.state['instruments'][inst]['h1_candles_count'] = len(self.h1_candles[inst])
-            self._add_log(f"🕯️ [{inst}] New 1H Candle. Total: {len(self.h1_candles[inst])}")
-            self.current_h1_candle[inst] = self._update_candle(None, price); self.current_h1_candle[inst]['start_time'] = h1_start
-            
-            if not self.state['instruments'][inst]['active_trade']:
-                bot = self.smc_bots[inst]
-                res = bot.analyze(self.h4_candles[inst], self.h1_candles[inst])
-                self.state['instruments'][inst]['analysis_status'] = res['details']
-                if res['action'] == 'taketrade':
-                    # --- SPREAD-AWARE TRADE EXECUTION ---
-                    bid = self.state['instruments'][inst]['bid']
-                    ask = self.state['instruments'][inst]['ask']
-                    
-                    if res['order_type'] == 'BUY':
-                        res['entry_price_with_spread'] = ask # We buy at the ask price
-                        stop_pips = ask - res['sl']
-                        res['units'] = self._calculate_units(inst, stop_pips)
-                    else: # SELL
-                        res['entry_price_with_spread'] = bid # We sell at the bid price
-                        stop_pips = res['sl'] - bid
-                        res['units'] = self._calculate_units(inst, stop_pips)
-
-                    if res['units'] > 0:
-                        res['live_pnl_usd'] = 0.0
-                        self.state['instruments'][inst]['active_trade'] = res
-                        lots = res.get('units', 0) / 100000.0
-                        self._add_log(f"🚨 [{inst}] TAKE TRADE: {res['order_type']} {lots:.2f} lots @ {res['entry_price_with_spread']:.2f}")
-        
-        h4_start = timestamp.replace(hour=(timestamp.hour//4)*4, minute=0, second=0, microsecond=0)
-        if self.current_h4_candle[inst] is None: self.current_h4_candle[inst] = self._update_candle(None, price); self.current_h4_candle[inst]['start_time'] = h4_start
-        if h4_start > self.current_h4_candle[inst]['start_time']:
-            c = self.current_h4_candle[inst]
-            self.h4_candles[inst].append({"time": int(c['start_time'].timestamp()), "open":c['open'],"high":c['high'],"low":c['low'],"close":c['close'],"volume":0})
-            self.state['instruments'][inst]['h4_candles_count'] = len(self.h4_candles[inst])
-            self._add_log(f"🕯️ [{inst}] New 4H Candle. Total: {len(self.h4_candles[inst])}")
-            self.current_h4_candle[inst] = self._update_candle(None, price); self.current_h4_candle[inst]['start_time'] = h4_start
-        
-        self.current_h1_candle[inst] = self._update_candle(self.current_h1_candle[inst], price)
-        self.current_h4_candle[inst] = self._update_candle(self.current_h4_candle[inst], price)
+    def _close_trade(self, inst: str, position_id: int, price: float, reason: str, units: Optional[int] = None, level: Optional[int] = None):
+         """Closes `units` of a position (all of it by default); `level` is the TP level that triggered, if any."""
+         book = self.books[inst]
+         if units is None: units = book.positions[position_id]['units']
+         if self.gateway: self.gateway.submit_close(inst, book.positions[position_id], units)
+         book.close(position_id, units, price, level)
+         self._add_log(f"🎯 [{inst}] {reason} HIT AT {price:.{price_decimals(inst)}f}")
+         if self.journal: self.journal.record('close', inst=inst, id=position_id, units=units, price=price, reason=reason, level=level)
 
-    def stream(self):
-        last_render = 0
+    def _aggregate_candles(self, inst: str, price: float, ts: float):
+        self.aggregators[inst].update(price, int(ts))
+
+    def _store_closed_candle(self, inst: str, timeframe: str, candle: Dict):
+        closed = self.candles[timeframe][inst]
+        closed.append(candle)
+        if self.journal: self.journal.record('candle', inst=inst, tf=timeframe, candle=candle)
+        if timeframe in ('H1', 'H4'): self.state['instruments'][inst][f"{timeframe.lower()}_candles_count"] = len(closed)
+        self._add_log(f"🕯️ [{inst}] New {timeframe[1:]}{timeframe[0]} Candle. Total: {len(closed)}")
+
+    def _analyze_on_close(self, inst: str, timeframe: str, candle: Dict):
+        if timeframe != 'H1' or len(self.books[inst].positions) >= self.max_positions: return
+        bot = self.smc_bots[inst]
+        pois_before = (frozenset(bot.mitigated_h1_pois), frozenset(bot.mitigated_h4_pois)) if self.journal else None
+        started = time.perf_counter_ns()
+        res = bot.analyze(self.h4_candles[inst], self.h1_candles[inst])
+        if self.monitor: self.monitor.record('analyze', time.perf_counter_ns() - started)
+        if self.journal: self._journal_pois(inst, pois_before)
+        self.state['instruments'][inst]['analysis_status'] = res.get('details', f"{res.get('order_type')} setup found")
+        if res['action'] == 'taketrade': self._open_trade(inst, res)
+
+    def stream(self, reconnect: bool = True):
+        # Rendering runs on its own thread; the loop below only ingests ticks. Without `reconnect` it returns once the stream ends.
+        renderer = None if self.headless else DashboardRenderer(self)
+        if renderer: renderer.start()
+        try:
+            while True:
+                try:
+                    self.state['connection_status'] = 'Connecting...'
+                    response = requests.get(self.url, headers=self.headers, params=self.params, stream=True, timeout=30)
+                    if response.status_code != 200:
+                        self.state['connection_status'] = f'Error {response.status_code}'; self._add_log(f"Connection Error: {response.text}")
+                        if not reconnect: return
+                        time.sleep(15); continue
+                    self.state['connection_status'] = 'Connected'; self._add_log("Connection successful.")
+                    completed = self.gateway.completed if self.gateway else None
+                    for line in response.iter_lines():
+                        if completed: self._apply_order_results()
+                        if not line: continue
+                        monitor = self.monitor
+                        started = time.perf_counter_ns() if monitor and monitor.due() else 0
+                        try: tick = json.loads(line.decode('utf-8'))
+                        except json.JSONDecodeError: continue
+                        if not started: self._handle_tick(tick); continue
+                        decoded = time.perf_counter_ns(); monitor.record('decode', decoded - started)
+                        self._handle_tick(tick); monitor.record('handle_tick', time.perf_counter_ns() - decoded)
+                    if not reconnect: return
+                except requests.exceptions.RequestException as e:
+                    self.state['connection_status'] = 'Connection Lost'; self._add_log(f"Connection Error: {e}")
+                    if not reconnect: return
+                    time.sleep(10)
+        finally:
+            if renderer: renderer.stop()
+
+    async def stream_async(self, max_backoff: float = 60.0, reconnect: bool = True):
+        """Asyncio counterpart of stream(): fast-path decoding, per-instrument tick coalescing, backoff reconnects."""
+        renderer = None if self.headless else DashboardRenderer(self)
+        if renderer: renderer.start()
+        client = AsyncPriceStream(self.url, self.headers, self.params)
+        instruments, backoff = self.state['instruments'], 1.0
+        try:
+            while True:
+                try:
+                    self.state['connection_status'] = 'Connecting...'
+                    connected = False
+                    async for lines in client.batches():
+                        if not connected:
+                            connected, backoff = True, 1.0
+                            self.state['connection_status'] = 'Connected'; self._add_log("Connection successful.")
+                        # Sampled batches record the mean per-line decode and per-tick handling cost
+                        monitor = self.monitor
+                        started = time.perf_counter_ns() if monitor and monitor.due() else 0
+                        bursts, recorder = {}, self.recorder
+                        for line in lines:
+                            tick = decode_price_line(line)
+                            if tick is None or tick[0] not in instruments: continue
+                            inst, ts, bid, ask = tick
+                            try: ts = parse_rfc3339(ts)
+                            except ValueError: continue
+                            if recorder: recorder.record(inst, int(ts * 1e9), bid, ask)  # Arrival order, before grouping by instrument
+                            bursts.setdefault(inst, []).append((bid, ask, ts))
+                        if started and lines: decoded = time.perf_counter_ns(); monitor.record('decode', (decoded - started) // len(lines))
+                        for inst, ticks in bursts.items():
+                            if started: mark = time.perf_counter_ns()
+                            self._process_burst(inst, ticks)
+                            if started: monitor.record('handle_tick', (time.perf_counter_ns() - mark) // len(ticks))
+                            self.ticks_processed += len(ticks)
+                        self._end_batch()
+                    self.state['connection_status'] = 'Stream Closed'
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, StreamHTTPError) as e:
+                    self.state['connection_status'] = f'Error {e.status}' if isinstance(e, StreamHTTPError) else 'Connection Lost'
+                    self._add_log(f"Connection Error: {e}")
+                if not reconnect: return
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, max_backoff)
+        finally:
+            if renderer: renderer.stop()
+
+# ==============================================================================
+#  SHARDED MULTI-PROCESS RUNTIME (one ingest process, N analysis worker processes)
+# ==============================================================================
+class PriceBoard:
+    """Latest bid, ask, tick time and tick count per instrument as unlocked float64 rows in shared memory."""
+    FIELDS = 4  # bid, ask, time, ticks
+
+    def __init__(self, instruments: List[str], name: Optional[str] = None):
+        self.instruments = list(instruments)
+        self.rows = {inst: i * self.FIELDS for i, inst in enumerate(self.instruments)}
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=max(1, len(self.instruments)) * self.FIELDS * 8)
+        self.name = self.shm.name
+        self.values = self.shm.buf.cast('d')
+        if self.owner:
+            for i in range(len(self.values)): self.values[i] = 0.0
+
+    def update(self, inst: str, bid: float, ask: float, ts: float, count: int = 1):
+        row, values = self.rows[inst], self.values
+        values[row] = bid; values[row + 1] = ask; values[row + 2] = ts; values[row + 3] += count
+
+    def mid(self, inst: str) -> Optional[float]:
+        row = self.rows.get(inst)
+        if row is None or not self.values[row + 3]: return None
+        return (self.values[row] + self.values[row + 1]) / 2
+
+    def table(self) -> np.ndarray:
+        """Copy of the whole board, one (bid, ask, time, ticks) row per instrument."""
+        return np.frombuffer(self.shm.buf, dtype='<f8', count=len(self.instruments) * self.FIELDS).reshape(-1, self.FIELDS).copy()
+
+    def close(self):
+        self.values.release()
+        self.shm.close()
+        if self.owner: self.shm.unlink()
+
+class ShardTrader(LiveOandaTrader):
+    """A worker process's trader: runs its shard's pipeline and reports logs, status and trades to the ingest process as events."""
+    def __init__(self, instruments: List[str], events: multiprocessing.Queue, board: PriceBoard, **kwargs):
+        super().__init__(instruments, headless=True, **kwargs)
+        self.events = events
+        self.board = board
+
+    def publish_state(self):
+        for inst in self.instrument_list:
+            self._publish_status(inst)
+            for position in self.books[inst].positions.values(): self.events.put(('open', inst, PositionBook.record(position)))
+
+    def _publish_status(self, inst: str):
+        data = self.state['instruments'][inst]
+        self.events.put(('status', inst, {key: data[key] for key in ('analysis_status', 'h1_candles_count', 'h4_candles_count')}))
+
+    def _mid_price(self, inst: str) -> Optional[float]:
+        return self.board.mid(inst)
+
+    def _add_log(self, message: str):
+        self.events.put(('log', message))
+
+    def _analyze_on_close(self, inst: str, timeframe: str, candle: Dict):
+        super()._analyze_on_close(inst, timeframe, candle)
+        if timeframe in ('H1', 'H4'): self._publish_status(inst)
+
+    def _open_trade(self, inst: str, res: Dict):
+        super()._open_trade(inst, res)
+        if self.books[inst].positions.get(res.get('id')) is res: self.events.put(('open', inst, PositionBook.record(res)))
+
+    def _close_trade(self, inst: str, position_id: int, price: float, reason: str, units: Optional[int] = None, level: Optional[int] = None):
+        if units is None: units = self.books[inst].positions[position_id]['units']
+        self.events.put(('close', inst, position_id, units, price, level))
+        super()._close_trade(inst, position_id, price, reason, units, level)
+
+    def _drop_unfilled(self, inst: str, position_id: int, status: str):
+        position = self.books[inst].positions.get(position_id)
+        if position: self.events.put(('close', inst, position_id, position['units'], position['entry_price_with_spread'], None))
+        super()._drop_unfilled(inst, position_id, status)
+
+def _shard_worker(index: int, shards: int, instruments: List[str], universe: List[str], board_name: str,
+                  inbox: multiprocessing.Queue, events: multiprocessing.Queue, options: Dict):
+    """Worker process main loop: drains its inbox, merges queued batches per instrument and
+    runs each instrument's ticks through ShardTrader._process_burst. None shuts it down."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The ingest process owns Ctrl+C and sends the shutdown sentinel
+    board = PriceBoard(universe, board_name)
+    trader = ShardTrader(instruments, events, board, smc_params=options['smc_params'], risk_per_trade_usd=options['risk_per_trade_usd'],
+                         timeframes=options['timeframes'], max_positions=options['max_positions'],
+                         partial_take_profits=options['partial_take_profits'])
+    try:
+        if options['journal']: trader.enable_journal(StateJournal(os.path.join(STATE_DIR, f"shard-{index}-of-{shards}")))
+        if options['warm_start']: trader.warm_start()
+        if options['execute']: trader.enable_gateway(OrderGateway(options['broker_url'] or trader.api_url, trader.headers))
+        trader.publish_state()
+        running = True
+        while running:
+            batches = [inbox.get()]
+            while True:  # Whatever queued up during the last batch is merged, so a backlog costs one pass per instrument
+                try: batches.append(inbox.get_nowait())
+                except queue.Empty: break
+            bursts = {}
+            for batch in batches:
+                if batch is None: running = False; break
+                for inst, ticks in batch:
+                    if inst in bursts: bursts[inst].extend(ticks)
+                    else: bursts[inst] = list(ticks)
+            for inst, ticks in bursts.items(): trader._process_burst(inst, ticks)
+            trader._end_batch()
+    finally:
+        if trader.gateway: trader.gateway.stop(); trader._apply_order_results()
+        if trader.journal: trader.journal.close()
+        trader.board = None
+        board.close()
+
+class ShardedOandaTrader(LiveOandaTrader):
+    """Ingest side of the sharded runtime: writes each tick to the PriceBoard and routes it to the worker process that owns
+    the instrument."""
+    def __init__(self, instruments: Union[str, List[str]], workers: int = SHARD_WORKERS, smc_params: Optional[Dict] = None,
+                 risk_per_trade_usd: float = RISK_PER_TRADE_USD, headless: bool = HEADLESS, timeframes: Iterable[str] = TIMEFRAMES,
+                 journal: bool = JOURNAL, warm_start: bool = WARM_START, max_positions: int = MAX_POSITIONS_PER_INSTRUMENT,
+                 partial_take_profits: Iterable[Tuple[float, float]] = PARTIAL_TAKE_PROFITS, execute: bool = EXECUTE_ORDERS,
+                 broker_url: Optional[str] = None):
+        super().__init__(instruments, risk_per_trade_usd=risk_per_trade_usd, headless=headless, timeframes=timeframes,
+                         max_positions=max_positions, partial_take_profits=partial_take_profits)
+        shards = max(1, min(workers or os.cpu_count() or 1, len(self.instrument_list)))
+        self.shards = [self.instrument_list[i::shards] for i in range(shards)]
+        self.shard_of = {inst: i for i, shard in enumerate(self.shards) for inst in shard}
+        self.board = PriceBoard(self.instrument_list)
+        context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+        self.inboxes = [context.Queue() for _ in self.shards]
+        self.events = context.Queue()
+        options = {'smc_params': smc_params, 'risk_per_trade_usd': risk_per_trade_usd, 'timeframes': tuple(timeframes),
+                   'max_positions': max_positions, 'partial_take_profits': self.partial_take_profits, 'journal': journal, 'warm_start': warm_start,
+                   'execute': execute, 'broker_url': broker_url}
+        self.processes = [context.Process(target=_shard_worker, name=f"shard-{i}", daemon=True,
+                                          args=(i, shards, shard, self.instrument_list, self.board.name, self.inboxes[i], self.events, options))
+                          for i, shard in enumerate(self.shards)]
+        self._pending = [[] for _ in self.shards]
+        self._event_thread = threading.Thread(target=self._apply_events, name="shard-events", daemon=True)
+
+    def start(self):
+        for process in self.processes: process.start()
+        self._event_thread.start()
+        self._add_log(f"🧩 {len(self.instrument_list)} instruments sharded over {len(self.processes)} worker processes")
+
+    def close(self, timeout: float = 10.0):
+        for inbox in self.inboxes: inbox.put(None)
+        for process in self.processes: process.join(timeout)
+        self.events.put(None)
+        self._event_thread.join(timeout)
+        self.board.close()
+
+    def _apply_events(self):
+        instruments = self.state['instruments']
         while True:
+            event = self.events.get()
+            if event is None: return
+            kind = event[0]
+            if kind == 'log': self._add_log(event[1])
+            elif kind == 'status': instruments[event[1]].update(event[2])
+            elif kind == 'open': self.books[event[1]].add(event[2])
+            elif kind == 'close' and event[2] in self.books[event[1]].positions: self.books[event[1]].close(*event[2:])
+
+    def _process_price(self, inst: str, bid: float, ask: float, ts: float):
+        started = self._count_ticks(inst, 1, ts) if self.monitor else 0
+        self.board.update(inst, bid, ask, ts)
+        self.inboxes[self.shard_of[inst]].put([(inst, [(bid, ask, ts)])])
+        if started: self.monitor.record('process_price', time.perf_counter_ns() - started)
+
+    def _process_burst(self, inst: str, ticks: List[Tuple[float, float, float]]):
+        started = self._count_ticks(inst, len(ticks), ticks[-1][2]) if self.monitor else 0
+        self.board.update(inst, *ticks[-1], count=len(ticks))
+        self._pending[self.shard_of[inst]].append((inst, ticks))
+        if started: self.monitor.record('process_price', time.perf_counter_ns() - started)
+
+    def _count_ticks(self, inst: str, count: int, ts: float) -> int:
+        """Tick counts and lag for the monitor, taken on arrival since the workers run the rest of the pipeline;
+        a burst is one countdown step, sampled on its latest tick."""
+        monitor = self.monitor
+        monitor.ticks[inst] += count
+        monitor.countdown -= 1
+        return monitor.sample(inst, ts) if not monitor.countdown else 0
+
+    def _end_batch(self):
+        for shard, pending in enumerate(self._pending):
+            if pending:
+                self.inboxes[shard].put(pending)
+                self._pending[shard] = []
+
+    def snapshot(self) -> Dict:
+        for inst, (bid, ask, _, ticks) in zip(self.instrument_list, self.board.table().tolist()):
+            if not ticks: continue
+            data = self.state['instruments'][inst]
+            data['bid'], data['ask'], data['price'], data['spread'] = bid, ask, (bid + ask) / 2, (ask - bid) / self.pip_sizes[inst]
+            data['live_pnl_usd'] = self.books[inst].unrealized(bid, ask)
+        return super().snapshot()
+
+# ==============================================================================
+#  TICK REPLAY BACKTESTING (same pipeline as LiveOandaTrader, no network/render)
+# ==============================================================================
+def load_tick_file(path: str) -> Iterator[Dict]:
+    """Yields recorded OANDA pricing-stream messages from a JSON-lines file."""
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                try: yield json.loads(line)
+                except json.JSONDecodeError: continue
+
+def synthetic_ticks(instrument: str, start: float, count: int, price: float = 2000.0, interval: float = 5.0,
+                    volatility: float = 0.0004, spread: float = 0.0002, seed: int = 0) -> Iterator[Tuple[str, float, float, float]]:
+    """Seeded random-walk (instrument, epoch_seconds, bid, ask) ticks with volatility regimes."""
+    rng = random.Random(seed)
+    t, vol = start, volatility
+    for _ in range(count):
+        if rng.random() < 0.001: vol = volatility * rng.choice((0.5, 1.0, 2.0, 4.0))
+        price *= 1.0 + rng.gauss(0.0, vol)
+        half = price * spread / 2
+        yield instrument, t, price - half, price + half
+        t += interval * rng.uniform(0.2, 1.8)
+
+class ReplayTrader(LiveOandaTrader):
+    """Drives recorded PRICE messages or (instrument, epoch_seconds, bid, ask) tuples through LiveOandaTrader's tick pipeline
+    as fast as possible; every closed trade lands in the ledger."""
+    def __init__(self, instruments: str, **kwargs):
+        super().__init__(instruments, **kwargs)
+        self.ledger = []
+        self.elapsed = 0.0
+        self._clock = None
+
+    def run(self, ticks: Iterable[Union[Dict, Tuple[str, float, float, float]]]) -> Dict:
+        started = time.perf_counter()
+        handle_tick, process_price = self._handle_tick, self._process_price
+        count = 0
+        for tick in ticks:
+            count += 1
+            if isinstance(tick, dict):
+                self._clock = tick.get('time')
+                handle_tick(tick)
+            else:
+                inst, ts, bid, ask = tick
+                if inst not in self.state['instruments']: continue
+                self._clock = ts
+                process_price(inst, bid, ask, ts)
+        for inst, data in self.state['instruments'].items():
+            for position_id, trade in list(data['positions'].items()):
+                self._close_trade(inst, position_id, data['bid'] if trade['order_type'] == 'BUY' else data['ask'], "END OF REPLAY")
+        self.ticks_processed += count
+        self.elapsed += time.perf_counter() - started
+        return self.summary()
+
+    def _open_trade(self, inst: str, res: Dict):
+        super()._open_trade(inst, res)
+        if self.books[inst].positions.get(res.get('id')) is res: res['entry_time'] = self._clock_seconds()
+
+    def _clock_seconds(self) -> Optional[float]:
+        """Current tick time as epoch seconds (PRICE messages carry RFC3339 strings)."""
+        return parse_rfc3339(self._clock) if isinstance(self._clock, str) else self._clock
+
+    def _close_trade(self, inst: str, position_id: int, price: float, reason: str, units: Optional[int] = None, level: Optional[int] = None):
+        trade = self.books[inst].positions[position_id]
+        if units is None: units = trade['units']
+        if trade['order_type'] == 'BUY': pnl_usd = (price - trade['entry_price_with_spread']) * units
+        else: pnl_usd = (trade['entry_price_with_spread'] - price) * units
+        self.ledger.append({
+            "instrument": inst, "id": position_id, "order_type": trade['order_type'], "units": units,
+            "entry_time": trade.get('entry_time'), "entry": trade['entry_price_with_spread'], "sl": trade['sl'], "tp": trade['tp'],
+            "exit_time": self._clock_seconds(), "exit": price, "reason": reason, "pnl_usd": pnl_usd
+        })
+        super()._close_trade(inst, position_id, price, reason, units, level)
+
+    def summary(self) -> Dict:
+        pnls = [t['pnl_usd'] for t in self.ledger]
+        gross_win = sum(p for p in pnls if p > 0)
+        gross_loss = -sum(p for p in pnls if p < 0)
+        equity = peak = max_drawdown = 0.0
+        for p in pnls:
+            equity += p; peak = max(peak, equity); max_drawdown = max(max_drawdown, peak - equity)
+        wins = sum(1 for p in pnls if p > 0)
+        return {
+            "trades": len(pnls), "wins": wins, "losses": sum(1 for p in pnls if p < 0),
+            "win_rate": wins / len(pnls) if pnls else 0.0, "total_pnl_usd": sum(pnls, 0.0),
+            "avg_pnl_usd": sum(pnls) / len(pnls) if pnls else 0.0,
+            "profit_factor": gross_win / gross_loss if gross_loss else None if gross_win else 0.0,  # None: no losing trades
+            "max_drawdown_usd": max_drawdown, "ticks": self.ticks_processed, "elapsed_s": self.elapsed,
+            "ticks_per_s": self.ticks_processed / self.elapsed if self.elapsed else 0.0
+        }
+
+def print_replay_report(trader: ReplayTrader, summary: Dict):
+    print(Style.BRIGHT + Fore.CYAN + "=== Replay Trade Ledger ===")
+    header = f"{'Instrument':<12} | {'Type':<5} | {'Entry':<12} | {'Exit':<12} | {'Reason':<14} | {'P/L (USD)'}"
+    print(header); print("-" * len(header))
+    for t in trader.ledger:
+        pnl_color = Fore.GREEN if t['pnl_usd'] >= 0 else Fore.RED
+        print(f"{t['instrument']:<12} | {t['order_type']:<5} | {t['entry']:<12.{price_decimals(t['instrument'])}f} | {t['exit']:<12.{price_decimals(t['instrument'])}f} | {t['reason']:<14} | {pnl_color}${t['pnl_usd']:+.2f}")
+    print(Style.BRIGHT + Fore.YELLOW + "\n--- Summary ---")
+    for key, value in summary.items():
+        print(f"{key:<18} {value:.4f}" if isinstance(value, float) else f"{key:<18} {value}")
+
+# ==============================================================================
+#  PARAMETER SWEEP (process pool over params x instruments x date ranges)
+# ==============================================================================
+TICK_DTYPE = np.dtype([('time', '<f8'), ('bid', '<f8'), ('ask', '<f8')])
+
+# --- Parameters accepted in a sweep grid; the SMC ones are passed to SMCBot ---
+SMC_PARAM_NAMES = ('min_candles', 'default_tp_pct', 'strong_body_ratio')
+DEFAULT_SWEEP_GRID = {
+    'risk_per_trade_usd': [RISK_PER_TRADE_USD],
+    'default_tp_pct': [0.003, 0.005, 0.01],
+    'strong_body_ratio': [1.0, 1.5, 2.0],
+    'min_candles': [5, 10],
+}
+
+def ticks_to_arrays(ticks: Iterable[Union[Dict, Tuple[str, float, float, float]]]) -> Dict[str, np.ndarray]:
+    """Groups PRICE messages or (instrument, epoch_seconds, bid, ask) tuples into per-instrument TICK_DTYPE arrays."""
+    rows = {}
+    for tick in ticks:
+        if isinstance(tick, dict):
+            if tick.get('type') != 'PRICE': continue
             try:
-                self.state['connection_status'] = 'Connecting...'
-                self.dashboard.render(self.state)
-                response = requests.get(self.url, headers=self.headers, params=self.params, stream=True, timeout=30)
-                if response.status_code != 200:
-                    self.state['connection_status'] = f'Error {response.status_code}'; self._add_log(f"Connection Error: {response.text}")
-                    self.dashboard.render(self.state); time.sleep(15); continue
-                self.state['connection_status'] = 'Connected'; self._add_log("Connection successful.")
-                for line in response.iter_lines():
-                    if line:
-                        try: self._handle_tick(json.loads(line.decode('utf-8')))
-                        except json.JSONDecodeError: continue
-                    uptime_seconds = int(time.time() - self.start_time)
-                    self.state['uptime'] = f"{uptime_seconds//3600}h {(uptime_seconds%3600)//60}m {uptime_seconds%60}s"
-                    if time.time() - last_render > 0.5: self.dashboard.render(self.state); last_render = time.time()
-            except requests.exceptions.RequestException as e:
-                self.state['connection_status'] = 'Connection Lost'; self._add_log(f"Connection Error: {e}")
-                self.dashboard.render(self.state); time.sleep(10)
+                tick = (tick['instrument'], parse_rfc3339(tick['time']),
+                        float(tick['bids'][0]['price']), float(tick['asks'][0]['price']))
+            except (KeyError, IndexError, ValueError): continue
+        rows.setdefault(tick[0], []).append(tick[1:])
+    arrays = {}
+    for inst, inst_rows in rows.items():
+        arr = np.array(inst_rows, dtype=TICK_DTYPE)
+        arrays[inst] = arr[np.argsort(arr['time'], kind='stable')]
+    return arrays
 
-if __name__ == "__main__":
-    trader = LiveOandaTrader(instruments=INSTRUMENTS)
+def expand_grid(grid: Dict[str, List]) -> List[Dict]:
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+def split_ranges(arr: np.ndarray, splits: int) -> List[Tuple[float, float]]:
+    """Splits an instrument's tick span into equal-length [start, end) date ranges."""
+    start, end = float(arr['time'][0]), float(arr['time'][-1]) + 1e-6
+    step = (end - start) / splits
+    return [(start + i * step, end if i == splits - 1 else start + (i + 1) * step) for i in range(splits)]
+
+# --- Worker-side read-only views into the parent's shared-memory tick blocks ---
+_SWEEP_TICKS = {}
+_SWEEP_SEGMENTS = []
+
+def _sweep_worker_init(blocks: Dict[str, Tuple[str, int]]):
+    for inst, (name, length) in blocks.items():
+        shm = shared_memory.SharedMemory(name=name)
+        _SWEEP_SEGMENTS.append(shm)
+        arr = np.ndarray((length,), dtype=TICK_DTYPE, buffer=shm.buf)
+        arr.flags.writeable = False
+        _SWEEP_TICKS[inst] = arr
+
+def _sweep_task(task: Tuple[Dict, str, float, float]) -> Dict:
+    params, inst, start, end = task
+    ticks = _SWEEP_TICKS[inst]
+    lo, hi = np.searchsorted(ticks['time'], [start, end])
+    window = ticks[lo:hi]
+    smc_params = {k: params[k] for k in SMC_PARAM_NAMES if k in params}
+    trader = ReplayTrader(inst, smc_params=smc_params, risk_per_trade_usd=params.get('risk_per_trade_usd', RISK_PER_TRADE_USD))
+    summary = trader.run(zip(itertools.repeat(inst), window['time'].tolist(), window['bid'].tolist(), window['ask'].tolist()))
+    return {"params": params, "instrument": inst, "start": start, "end": end, **summary}
+
+def run_sweep(tick_arrays: Dict[str, np.ndarray], grid: Dict[str, List], splits: int = 1,
+              workers: Optional[int] = None, rank_by: str = 'total_pnl_usd') -> List[Dict]:
+    """Replays every parameter set x instrument x date range on a process pool, best first; workers map the ticks
+    read-only from shared memory."""
+    param_sets = expand_grid(grid)
+    segments, blocks, tasks = [], {}, []
+    try:
+        for inst, arr in tick_arrays.items():
+            if not len(arr): continue
+            shm = shared_memory.SharedMemory(create=True, size=arr.nbytes)
+            segments.append(shm)
+            np.ndarray(arr.shape, dtype=TICK_DTYPE, buffer=shm.buf)[:] = arr
+            blocks[inst] = (shm.name, len(arr))
+            tasks += [(params, inst, start, end) for params in param_sets for start, end in split_ranges(arr, splits)]
+        context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_sweep_worker_init, initargs=(blocks,)) as pool:
+            results = list(pool.map(_sweep_task, tasks))
+    finally:
+        for shm in segments: shm.close(); shm.unlink()
+    results.sort(key=lambda r: r[rank_by], reverse=True)
+    return results
+
+def print_sweep_table(results: List[Dict], top: int = 20):
+    print(Style.BRIGHT + Fore.CYAN + f"=== Parameter Sweep: {len(results)} runs (top {min(top, len(results))}) ===")
+    header = f"{'#':<4} | {'Instrument':<10} | {'Range (UTC)':<23} | {'Trades':<6} | {'Win %':<6} | {'P/L (USD)':<11} | {'Max DD':<9} | Params"
+    print(header); print("-" * len(header))
+    for rank, r in enumerate(results[:top], 1):
+        day = lambda ts: datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%d')
+        params = ", ".join(f"{k}={v}" for k, v in r['params'].items())
+        pnl_color = Fore.GREEN if r['total_pnl_usd'] >= 0 else Fore.RED
+        print(f"{rank:<4} | {r['instrument']:<10} | {day(r['start'])} → {day(r['end']):<10} | {r['trades']:<6} | {r['win_rate'] * 100:<6.1f} | "
+              f"{pnl_color}{r['total_pnl_usd']:<+11.2f}{Style.RESET_ALL} | {r['max_drawdown_usd']:<9.2f} | {params}")
+
+# ==============================================================================
+#  BENCHMARK SUITE (seeded workloads, JSON results, regression check vs a baseline)
+# ==============================================================================
+BENCH_SIZES = (10, 100, 1000, 10000, 100000)
+BENCH_TOLERANCE = 0.10
+BENCH_IO_TOLERANCE = 0.50  # loopback HTTP and worker-thread handoffs swing far more than 10% between identical runs
+
+def synthetic_candles(count: int, start: int = 1_600_000_000, interval: int = 3600, price: float = 2000.0,
+                      volatility: float = 0.004, seed: int = 0) -> List[Dict]:
+    """Seeded random-walk OHLC candles (same dict shape as the live H1/H4 lists) with volatility regimes."""
+    rng = random.Random(seed)
+    candles, vol = [], volatility
+    for i in range(count):
+        if rng.random() < 0.01: vol = volatility * rng.choice((0.5, 1.0, 2.0, 4.0))
+        close = price * (1.0 + rng.gauss(0.0, vol))
+        high = max(price, close) * (1.0 + abs(rng.gauss(0.0, vol / 2)))
+        low = min(price, close) * (1.0 - abs(rng.gauss(0.0, vol / 2)))
+        candles.append({"time": start + i * interval, "open": price, "high": high, "low": low, "close": close, "volume": 0})
+        price = close
+    return candles
+
+def resample_candles(candles: List[Dict], factor: int) -> List[Dict]:
+    """Merges every `factor` consecutive candles into one (e.g. H1 -> H4 with factor 4)."""
+    merged = []
+    for i in range(0, len(candles) - factor + 1, factor):
+        group = candles[i:i + factor]
+        merged.append({"time": group[0]['time'], "open": group[0]['open'], "high": max(c['high'] for c in group),
+                       "low": min(c['low'] for c in group), "close": group[-1]['close'], "volume": 0})
+    return merged
+
+def _bench_metric(value: float, unit: str, better: str = 'lower', gate: bool = True, tolerance: Optional[float] = None) -> Dict:
+    """One result; `gate` False marks single samples and tail percentiles that --baseline reports but never fails on,
+    and `tolerance` overrides --tolerance for gated metrics that are noisier than a best-of-N timing."""
+    return {"value": value, "unit": unit, "better": better, "gate": gate, "tolerance": tolerance}
+
+def _latency_metrics(name: str, samples_ns: List[int]) -> Dict[str, Dict]:
+    samples = sorted(samples_ns)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] / 1e3
+    return {f"{name}.p50_us": _bench_metric(pick(0.5), 'us'), f"{name}.p99_us": _bench_metric(pick(0.99), 'us', gate=False)}
+
+def bench_analyze(engine: str, sizes: Iterable[int] = BENCH_SIZES, repeat: int = 100, seed: int = 0, rounds: int = 3) -> Dict[str, Dict]:
+    """SMCBot.analyze latency as H1 history grows: a cold call on `size` candles, then `repeat` live-style calls
+    that each follow one newly closed H1 candle (H4 grows every fourth); p50 is the best of `rounds` fresh bots."""
+    results = {}
+    h1_all = synthetic_candles(max(sizes) + repeat, seed=seed)
+    h4_all = resample_candles(h1_all, 4)
+    for size in sizes:
+        cold, samples, p50 = None, [], float('inf')
+        for _ in range(rounds):
+            h1, h4 = h1_all[:size], h4_all[:size // 4]
+            bot = SMC_ENGINES[engine]('BENCH')
+            started = time.perf_counter_ns(); bot.analyze(h4, h1)
+            if cold is None: cold = time.perf_counter_ns() - started
+            run = []
+            for i in range(size, size + repeat):
+                h1.append(h1_all[i])
+                if (i + 1) % 4 == 0: h4.append(h4_all[i // 4])
+                started = time.perf_counter_ns(); bot.analyze(h4, h1); run.append(time.perf_counter_ns() - started)
+            p50 = min(p50, sorted(run)[len(run) // 2]); samples += run
+        results[f"analyze.{engine}.n={size}.cold_us"] = _bench_metric(cold / 1e3, 'us', gate=False)
+        results.update(_latency_metrics(f"analyze.{engine}.n={size}", samples))
+        results[f"analyze.{engine}.n={size}.p50_us"] = _bench_metric(p50 / 1e3, 'us')
+    return results
+
+def _bench_price_messages(instruments: List[str], count: int, seed: int) -> List[Dict]:
+    start = 1_600_000_000.0
+    sources = [synthetic_ticks(inst, start, count // len(instruments), seed=seed + i) for i, inst in enumerate(instruments)]
+    iso = lambda ts: datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f') + '000Z'
+    return [{"type": "PRICE", "instrument": inst, "time": iso(ts), "bids": [{"price": f"{bid:.5f}", "liquidity": 1000000}],
+             "asks": [{"price": f"{ask:.5f}", "liquidity": 1000000}], "status": "tradeable"}
+            for inst, ts, bid, ask in heapq.merge(*sources, key=lambda tick: tick[1])]
+
+def bench_handle_tick(count: int = 200_000, instruments: str = INSTRUMENTS, seed: int = 0, rounds: int = 3, chunk: int = 10_000) -> Dict[str, Dict]:
+    """End-to-end _handle_tick throughput on PRICE messages with no journal or recorder (fastest `chunk` over `rounds` traders)."""
+    messages = _bench_price_messages(instruments.split(','), count, seed)
+    best = float('inf')
+    for _ in range(rounds):
+        handle_tick = LiveOandaTrader(instruments, headless=True)._handle_tick
+        for i in range(0, len(messages), chunk):
+            part = messages[i:i + chunk]
+            started = time.perf_counter_ns()
+            for message in part: handle_tick(message)
+            best = min(best, (time.perf_counter_ns() - started) / len(part))
+    return {"handle_tick.ticks_per_s": _bench_metric(1e9 / best, 'ticks/s', 'higher'),
+            "handle_tick.ns_per_tick": _bench_metric(best, 'ns')}
+
+def bench_track_trade(count: int = 200_000, seed: int = 0, rounds: int = 5, chunk: int = 10_000,
+                      position_counts: Iterable[int] = (100, 1000)) -> Dict[str, Dict]:
+    """Per-tick cost of _track_positions with positions whose SL/TP are never hit (fastest `chunk` over `rounds`),
+    and over one pass where they all close."""
+    rng, results = random.Random(seed), {}
+    quotes = [(bid, ask) for _, _, bid, ask in synthetic_ticks('XAU_USD', 0.0, count, seed=seed)]
+    low, high = min(bid for bid, _ in quotes), max(ask for _, ask in quotes)
+    def position(order_type: str, sl: float, tp: float) -> Dict:
+        return {"order_type": order_type, "entry_price_with_spread": (low + high) / 2, "sl": sl, "tp": tp, "units": 100}
+    def far(order_type: str) -> Dict:
+        if order_type == 'BUY': return position('BUY', rng.uniform(0.5, 0.9) * low, rng.uniform(1.1, 2.0) * high)
+        return position('SELL', rng.uniform(1.1, 2.0) * high, rng.uniform(0.5, 0.9) * low)
+    books = [(label, [far(order_type) for order_type in order_types])
+             for label, order_types in [('buy', ['BUY']), ('sell', ['SELL'])] + [(f"n={n}", ['BUY', 'SELL'] * (n // 2)) for n in position_counts]]
+    for label, positions in books:
+        trader = LiveOandaTrader('XAU_USD', headless=True)
+        data = trader.state['instruments']['XAU_USD']
+        for p in positions: trader.books['XAU_USD'].add(p)
+        track, best = trader._track_positions, float('inf')
+        for _ in range(rounds):
+            for i in range(0, len(quotes), chunk):
+                part = quotes[i:i + chunk]
+                started = time.perf_counter_ns()
+                for bid, ask in part:
+                    data['bid'] = bid; data['ask'] = ask
+                    track('XAU_USD')
+                best = min(best, (time.perf_counter_ns() - started) / len(part))
+        results[f"track_trade.{label}.ns_per_tick"] = _bench_metric(best, 'ns')
+    # Positions whose SL/TP lie inside the price path, so every one of them closes during the run.
+    trader = LiveOandaTrader('XAU_USD', headless=True)
+    data, book = trader.state['instruments']['XAU_USD'], trader.books['XAU_USD']
+    for n in range(max(position_counts, default=1000)):
+        mid = rng.uniform(low, high)
+        book.add(position('BUY', mid - (high - low) * 0.2, mid + (high - low) * 0.2) if n % 2 else
+                 position('SELL', mid + (high - low) * 0.2, mid - (high - low) * 0.2))
+    track = trader._track_positions
+    started = time.perf_counter_ns()
+    for bid, ask in quotes:
+        data['bid'] = bid; data['ask'] = ask
+        track('XAU_USD')
+    results["track_trade.closing.ns_per_tick"] = _bench_metric((time.perf_counter_ns() - started) / len(quotes), 'ns', gate=False)
+    return results
+
+def bench_memory(engine: str, size: int, ticks: int, seed: int = 0) -> Dict[str, Dict]:
+    """Peak Python heap (tracemalloc) for analyze() on `size` candles and for a headless tick run, plus process peak RSS."""
+    results = {}
+    h1 = synthetic_candles(size, seed=seed)
+    h4 = resample_candles(h1, 4)
+    tracemalloc.start()
+    SMC_ENGINES[engine]('BENCH').analyze(h4, h1)
+    results[f"memory.analyze.{engine}.n={size}.peak_mb"] = _bench_metric(tracemalloc.get_traced_memory()[1] / 2**20, 'MB')
+    tracemalloc.stop()
+    del h1, h4
+    trader = LiveOandaTrader(INSTRUMENTS, headless=True)
+    messages = _bench_price_messages(trader.instrument_list, ticks, seed)
+    tracemalloc.start()
+    for message in messages: trader._handle_tick(message)
+    results["memory.handle_tick.peak_mb"] = _bench_metric(tracemalloc.get_traced_memory()[1] / 2**20, 'MB')
+    tracemalloc.stop()
     try:
-        trader.stream()
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        results["memory.process.peak_rss_mb"] = _bench_metric(rss / (2**20 if sys.platform == 'darwin' else 2**10), 'MB')
+    except ImportError: pass
+    return results
+
+def bench_order_gateway(count: int = 500, seed: int = 0) -> Dict[str, Dict]:
+    """OrderGateway against a local MockBroker: submit_open() cost, and round trips over the pooled vs a fresh connection."""
+    broker = MockBroker(seed=seed)
+    url = broker.start()
+    gateway = OrderGateway(url, {'Authorization': 'Bearer bench'}, workers=1)
+    gateway.start()
+    submit, round_trip, unpooled = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    try:
+        for n in range(1, count + 1):
+            position = {"id": n, "order_type": 'BUY' if n % 2 else 'SELL', "units": 100, "sl": 1900.0 if n % 2 else 2100.0}
+            started = time.perf_counter_ns()
+            gateway.submit_open('XAU_USD', position)
+            submit.record(time.perf_counter_ns() - started)
+            while not gateway.completed: time.sleep(0)
+            order = gateway.completed.popleft()
+            round_trip.record(order['acked'] - order['decided'])
+            started = time.perf_counter_ns()
+            requests.post(f"{gateway.base}/orders", data=order['body'].replace(b'"id":"fx-', b'"id":"cold-'), headers=gateway.headers, timeout=gateway.timeout)
+            unpooled.record(time.perf_counter_ns() - started)
+    finally:
+        gateway.stop()
+        broker.stop()
+    return {"orders.submit.ns": _bench_metric(submit.percentiles((50,))[0], 'ns', tolerance=BENCH_IO_TOLERANCE),
+            "orders.round_trip.p50_us": _bench_metric(round_trip.percentiles((50,))[0] / 1e3, 'us', tolerance=BENCH_IO_TOLERANCE),
+            "orders.round_trip.p99_us": _bench_metric(round_trip.percentiles((99,))[0] / 1e3, 'us', gate=False),
+            "orders.unpooled.p50_us": _bench_metric(unpooled.percentiles((50,))[0] / 1e3, 'us', gate=False)}
+
+def bench_stream(count: int = 200_000, instruments: str = INSTRUMENTS, seed: int = 0, rounds: int = 3) -> Dict[str, Dict]:
+    """Headless stream() (requests, one json.loads per line) vs stream_async() (fast-path decoding, coalesced bursts)
+    consuming the same canned PRICE lines from a local MockBroker stream, best of `rounds` fresh traders each."""
+    lines = [json.dumps(message, separators=(',', ':')).encode() for message in _bench_price_messages(instruments.split(','), count, seed)]
+    broker = MockBroker(seed=seed, stream_lines=lines)
+    url = broker.start() + "/v3/accounts/bench/pricing/stream"
+    best = {'requests': float('inf'), 'asyncio': float('inf')}
+    try:
+        for _ in range(rounds):
+            for client in best:
+                trader = LiveOandaTrader(instruments, headless=True)
+                trader.url = url
+                started = time.perf_counter()
+                if client == 'requests': trader.stream(reconnect=False)
+                else: asyncio.run(trader.stream_async(reconnect=False))
+                best[client] = min(best[client], time.perf_counter() - started)
+                if trader.state['connection_status'] not in ('Connected', 'Stream Closed'):  # Where each ends after a clean close
+                    raise RuntimeError(f"{client} stream failed: {trader.state['connection_status']}")
+    finally:
+        broker.stop()
+    return {f"stream.{client}.ticks_per_s": _bench_metric(len(lines) / elapsed, 'ticks/s', 'higher', tolerance=BENCH_IO_TOLERANCE)
+            for client, elapsed in best.items()}
+
+def run_benchmarks(engines: Iterable[str] = (SMC_ENGINE,), sizes: Iterable[int] = BENCH_SIZES, ticks: int = 200_000,
+                   repeat: int = 100, seed: int = 0, progress: Callable[[str], None] = lambda name: None) -> Dict:
+    sizes = sorted(sizes)
+    results = {}
+    for engine in engines:
+        progress(f"analyze ({engine})"); results.update(bench_analyze(engine, sizes, repeat, seed))
+    progress("handle_tick"); results.update(bench_handle_tick(ticks, seed=seed))
+    progress("track_trade"); results.update(bench_track_trade(ticks, seed=seed))
+    progress("order gateway"); results.update(bench_order_gateway(seed=seed))
+    progress("stream"); results.update(bench_stream(ticks, seed=seed))
+    progress("memory"); results.update(bench_memory(SMC_ENGINE, sizes[-1], ticks, seed))
+    meta = {"created": datetime.now(timezone.utc).isoformat(timespec='seconds'), "python": platform.python_version(),
+            "numpy": np.__version__, "platform": platform.platform(), "seed": seed, "sizes": sizes, "ticks": ticks,
+            "repeat": repeat, "engines": list(engines)}
+    return {"meta": meta, "results": results}
+
+def compare_benchmarks(current: Dict, baseline: Dict, tolerance: float = BENCH_TOLERANCE) -> List[Dict]:
+    """Per-metric change vs the baseline; a gated metric regresses when it got worse by more than its own tolerance
+    from the JSON, else `tolerance` (a fraction)."""
+    rows = []
+    for name, metric in current['results'].items():
+        old = baseline['results'].get(name)
+        if not old or not old['value']: continue
+        change = (metric['value'] - old['value']) / old['value']
+        worse = change if metric['better'] == 'lower' else -change
+        gate = metric.get('gate', True)
+        rows.append({"metric": name, "baseline": old['value'], "current": metric['value'], "unit": metric['unit'],
+                     "change": change, "gate": gate, "regression": gate and worse > (metric.get('tolerance') or tolerance)})
+    return rows
+
+def print_bench_table(report: Dict, comparison: Optional[List[Dict]] = None):
+    meta = report['meta']
+    print(Style.BRIGHT + Fore.CYAN + f"=== Benchmarks (seed {meta['seed']}, Python {meta['python']}, NumPy {meta['numpy']}) ===")
+    if comparison is None:
+        header = f"{'Metric':<44} | {'Value':>14} | Unit"
+        print(header); print("-" * len(header))
+        for name, metric in report['results'].items(): print(f"{name:<44} | {metric['value']:>14.2f} | {metric['unit']}")
+        return
+    header = f"{'Metric':<44} | {'Baseline':>12} | {'Current':>12} | {'Change':>8} | Status"
+    print(header); print("-" * len(header))
+    for row in comparison:
+        status = Fore.RED + "REGRESSION" if row['regression'] else Fore.GREEN + "ok" if row['gate'] else Style.DIM + "info"
+        print(f"{row['metric']:<44} | {row['baseline']:>12.2f} | {row['current']:>12.2f} | {row['change'] * 100:>+7.1f}% | {status}{Style.RESET_ALL}")
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="SMC trading bot for OANDA.")
+    sub = parser.add_subparsers(dest='command')
+    replay = sub.add_parser('replay', help="Backtest recorded or synthetic ticks through the live pipeline.")
+    replay.add_argument('tick_files', nargs='*', help="JSON-lines files of recorded OANDA pricing messages.")
+    replay.add_argument('--instruments', default=INSTRUMENTS)
+    replay.add_argument('--synthetic', type=int, default=0, metavar='N', help="Generate N synthetic ticks per instrument.")
+    replay.add_argument('--seed', type=int, default=0)
+    replay.add_argument('--tick-dir', help="Replay a TickRecorder directory instead of JSON-lines files.")
+    replay.add_argument('--start', help="With --tick-dir: first tick time (ISO 8601, UTC).")
+    replay.add_argument('--end', help="With --tick-dir: stop before this time (ISO 8601, UTC).")
+    replay.add_argument('--ledger', help="Write the trade ledger and summary to this JSON file.")
+    sweep = sub.add_parser('sweep', help="Backtest a parameter grid across instruments and date ranges on all cores.")
+    sweep.add_argument('tick_files', nargs='*', help="JSON-lines files of recorded OANDA pricing messages.")
+    sweep.add_argument('--instruments', default=INSTRUMENTS)
+    sweep.add_argument('--synthetic', type=int, default=0, metavar='N', help="Generate N synthetic ticks per instrument.")
+    sweep.add_argument('--seed', type=int, default=0)
+    sweep.add_argument('--tick-dir', help="Sweep over a TickRecorder directory instead of JSON-lines files.")
+    sweep.add_argument('--grid', help="JSON file mapping parameter names to lists of values.")
+    sweep.add_argument('--splits', type=int, default=1, help="Split each instrument's history into this many date ranges.")
+    sweep.add_argument('--workers', type=int, default=None)
+    sweep.add_argument('--top', type=int, default=20)
+    sweep.add_argument('--out', help="Write all ranked results to this JSON file.")
+    bench = sub.add_parser('bench', help="Run the seeded benchmark suite and optionally compare against a baseline.")
+    bench.add_argument('--engines', default=SMC_ENGINE, help="Comma-separated SMC engines to benchmark analyze() on.")
+    bench.add_argument('--sizes', default=",".join(map(str, BENCH_SIZES)), help="Comma-separated H1 history sizes for analyze().")
+    bench.add_argument('--ticks', type=int, default=200_000)
+    bench.add_argument('--repeat', type=int, default=100, help="analyze() calls timed per history size.")
+    bench.add_argument('--seed', type=int, default=0)
+    bench.add_argument('--out', help="Write results to this JSON file.")
+    bench.add_argument('--baseline', help="Compare against a JSON file written by an earlier --out.")
+    bench.add_argument('--tolerance', type=float, default=BENCH_TOLERANCE, help="Allowed slowdown before a metric counts as a regression (0.10 = 10%%).")
+    parser.add_argument('--instruments', default=INSTRUMENTS, help="Live instruments (comma-separated, or ALL for the FX and metals universe).")
+    parser.add_argument('--workers', type=int, default=SHARD_WORKERS, help="Shard the live bot over N worker processes (0 = single process).")
+    parser.add_argument('--headless', action='store_true', default=HEADLESS, help="Run the live bot without the dashboard.")
+    parser.add_argument('--no-warm-start', dest='warm_start', action='store_false', default=WARM_START, help="Start streaming with empty candle history.")
+    parser.add_argument('--no-journal', dest='journal', action='store_false', default=JOURNAL, help="Do not recover or journal runtime state.")
+    parser.add_argument('--record-ticks', metavar='DIR', nargs='?', const=TICK_DIR, default=TICK_DIR if RECORD_TICKS else None,
+                        help="Record every tick to a binary tick directory.")
+    parser.add_argument('--metrics', metavar='FILE', nargs='?', const=METRICS_FILE, default=METRICS_FILE if METRICS else None,
+                        help="Collect hot-path latency metrics and write them to FILE on exit (and on SIGUSR1 when live).")
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT, help="With --metrics: serve them as JSON on 127.0.0.1:PORT.")
+    parser.add_argument('--stream-client', choices=('requests', 'asyncio'), default=STREAM_CLIENT, help="Pricing stream client for the live bot.")
+    parser.add_argument('--execute', action='store_true', default=EXECUTE_ORDERS, help="Send opens and closes to the broker (default: track trades in memory only).")
+    parser.add_argument('--broker-url', help="With --execute: REST API base URL to send orders to instead of OANDA's (e.g. a MockBroker).")
+    args = parser.parse_args(argv)
+
+    if args.command == 'replay':
+        trader = ReplayTrader(instruments=args.instruments)
+        if args.metrics: trader.monitor = LatencyMonitor(trader.instrument_list)
+        if args.synthetic:
+            start = time.time() - args.synthetic * 5.0
+            sources = [synthetic_ticks(inst, start, args.synthetic, seed=args.seed + i) for i, inst in enumerate(trader.instrument_list)]
+            ticks = heapq.merge(*sources, key=lambda tick: tick[1])
+        elif args.tick_dir:
+            to_ns = lambda iso: datetime_to_ns(datetime.fromisoformat(iso).replace(tzinfo=timezone.utc)) if iso else None
+            ticks = TickReader(args.tick_dir).iter_ticks(to_ns(args.start), to_ns(args.end))
+        else:
+            ticks = itertools.chain.from_iterable(load_tick_file(path) for path in args.tick_files)
+        summary = trader.run(ticks)
+        print_replay_report(trader, summary)
+        if args.metrics: trader.monitor.dump(args.metrics)
+        if args.ledger:
+            with open(args.ledger, 'w') as f: json.dump({"ledger": trader.ledger, "summary": summary}, f, indent=2)
+        return
+
+    if args.command == 'sweep':
+        instruments = args.instruments.split(',')
+        if args.synthetic:
+            start = time.time() - args.synthetic * 5.0
+            ticks = itertools.chain.from_iterable(synthetic_ticks(inst, start, args.synthetic, seed=args.seed + i) for i, inst in enumerate(instruments))
+        else:
+            ticks = itertools.chain.from_iterable(load_tick_file(path) for path in args.tick_files)
+        tick_arrays = TickReader(args.tick_dir).to_arrays() if args.tick_dir else ticks_to_arrays(ticks)
+        tick_arrays = {inst: arr for inst, arr in tick_arrays.items() if inst in instruments}
+        grid = DEFAULT_SWEEP_GRID
+        if args.grid:
+            with open(args.grid) as f: grid = json.load(f)
+        results = run_sweep(tick_arrays, grid, splits=args.splits, workers=args.workers)
+        print_sweep_table(results, args.top)
+        if args.out:
+            with open(args.out, 'w') as f: json.dump(results, f, indent=2)
+        return
+
+    if args.command == 'bench':
+        report = run_benchmarks(args.engines.split(','), [int(n) for n in args.sizes.split(',')], args.ticks, args.repeat, args.seed,
+                                progress=lambda name: print(Style.DIM + f"... {name}", file=sys.stderr))
+        if args.out:
+            with open(args.out, 'w') as f: json.dump(report, f, indent=2)
+        comparison = None
+        if args.baseline:
+            with open(args.baseline) as f: comparison = compare_benchmarks(report, json.load(f), args.tolerance)
+        print_bench_table(report, comparison)
+        if comparison and any(row['regression'] for row in comparison): sys.exit(1)
+        return
+
+    sharded = args.workers > 0
+    if sharded: trader = ShardedOandaTrader(args.instruments, workers=args.workers, headless=args.headless, journal=args.journal, warm_start=args.warm_start,
+                                            execute=args.execute, broker_url=args.broker_url)
+    else: trader = LiveOandaTrader(instruments=args.instruments, headless=args.headless)
+    try:
+        if sharded: trader.start()  # Workers journal and warm start their own shards
+        elif args.journal: trader.enable_journal(StateJournal())
+        if args.execute and not sharded: trader.enable_gateway(OrderGateway(args.broker_url or trader.api_url, trader.headers))
+        if args.record_ticks: trader.recorder = TickRecorder(args.record_ticks)
+        if args.metrics:
+            trader.monitor = LatencyMonitor(trader.instrument_list)
+            trader.monitor.gateway = trader.gateway
+            if args.metrics_port: trader.monitor.serve(args.metrics_port)
+            if hasattr(signal, 'SIGUSR1'): signal.signal(signal.SIGUSR1, lambda *_: trader.monitor.dump(args.metrics))
+        if args.warm_start and not sharded: trader.warm_start()
+        if args.stream_client == 'asyncio': asyncio.run(trader.stream_async())
+        else: trader.stream()
     except KeyboardInterrupt:
         print(Style.BRIGHT + Fore.YELLOW + "\n\n🔌 Disconnected by user. Goodbye, Israel!")
+    finally:
+        if sharded: trader.close()
+        if trader.gateway: trader.gateway.stop(); trader._apply_order_results()
+        if trader.journal: trader.journal.close()
+        if trader.recorder: trader.recorder.close()
+        if trader.monitor: trader.monitor.dump(args.metrics)
+
+if __name__ == "__main__":
+    main()
 
 
@@ -0,0 +1,41 @@
+import fx
+
+
+def report(**values):
+    return {"results": {name: metric for name, metric in values.items()}}
+
+
+def test_only_gated_metrics_regress():
+    baseline = report(best=fx._bench_metric(100.0, 'ns'), cold=fx._bench_metric(100.0, 'us', gate=False),
+                      rate=fx._bench_metric(1000.0, 'ticks/s', 'higher'))
+    current = report(best=fx._bench_metric(115.0, 'ns'), cold=fx._bench_metric(500.0, 'us', gate=False),
+                     rate=fx._bench_metric(950.0, 'ticks/s', 'higher'))
+    rows = {row['metric']: row for row in fx.compare_benchmarks(current, baseline, 0.10)}
+    assert rows['best']['regression']
+    assert not rows['cold']['regression'] and not rows['cold']['gate']
+    assert not rows['rate']['regression']
+
+
+def test_per_metric_tolerance_overrides_default():
+    baseline = report(io=fx._bench_metric(100.0, 'us', tolerance=0.5))
+    assert not fx.compare_benchmarks(report(io=fx._bench_metric(140.0, 'us', tolerance=0.5)), baseline, 0.10)[0]['regression']
+    assert fx.compare_benchmarks(report(io=fx._bench_metric(160.0, 'us', tolerance=0.5)), baseline, 0.10)[0]['regression']
+
+
+def test_older_baselines_without_gate_fields_still_compare():
+    baseline = {"results": {"best": {"value": 100.0, "unit": 'ns', "better": 'lower'}}}
+    current = {"results": {"best": {"value": 120.0, "unit": 'ns', "better": 'lower'}}}
+    assert fx.compare_benchmarks(current, baseline, 0.10)[0]['regression']
+
+
+def test_singleshot_and_tail_metrics_are_not_gated():
+    results = fx.bench_analyze('incremental', [10], repeat=5)
+    assert not results['analyze.incremental.n=10.cold_us']['gate']
+    assert not results['analyze.incremental.n=10.p99_us']['gate']
+    assert results['analyze.incremental.n=10.p50_us']['gate']
+
+
+def test_bench_stream_reports_both_clients():
+    results = fx.bench_stream(2000, rounds=1)
+    assert set(results) == {'stream.requests.ticks_per_s', 'stream.asyncio.ticks_per_s'}
+    assert all(metric['value'] > 0 and metric['better'] == 'higher' for metric in results.values())
@@ -0,0 +1,26 @@
+import random
+from datetime import datetime, timezone
+
+import pytest
+
+import fx
+
+
+@pytest.mark.parametrize('fraction', ['', '.5', '.123456789', '.999999', '.9999995', '.999999999'])
+def test_parse_rfc3339_matches_fromisoformat(fraction):
+    rng = random.Random(fraction)
+    for _ in range(2000):
+        stamp = datetime.fromtimestamp(rng.randint(1_600_000_000, 1_800_000_000), timezone.utc).strftime('%Y-%m-%dT%H:%M:%S') + fraction + 'Z'
+        assert fx.parse_rfc3339(stamp) == datetime.fromisoformat(stamp.replace('Z', '+00:00')).timestamp(), stamp
+
+
+def test_last_nanosecond_stays_in_its_candle():
+    closed = []
+    aggregator = fx.CandleAggregator('EUR_USD', ('H1', 'H4'))
+    aggregator.subscribe(lambda inst, tf, candle: closed.append((tf, candle)))
+    for stamp, price in (('2024-06-21T12:00:00.000000000Z', 1.0), ('2024-06-21T12:59:59.999999999Z', 2.0), ('2024-06-21T13:00:00.000000001Z', 3.0)):
+        aggregator.update(price, int(fx.parse_rfc3339(stamp)))
+    (tf, candle), = closed
+    assert tf == 'H1' and candle['time'] == int(datetime(2024, 6, 21, 12, tzinfo=timezone.utc).timestamp())
+    assert (candle['open'], candle['high'], candle['close']) == (1.0, 2.0, 2.0)
+    assert aggregator.current('H1')['open'] == 3.0 and aggregator.current('H4')['close'] == 3.0
@@ -0,0 +1,42 @@
+import fx
+
+CLEAR, NO_WRAP, WRAP = "\x1b[2J", "\x1b[?7l", "\x1b[?7h"
+
+
+def render(dashboard, capsys, lines):
+    dashboard.build_lines = lambda state: list(lines)
+    dashboard.render({})
+    return capsys.readouterr().out
+
+
+def test_first_frame_clears_and_paints_every_row(capsys):
+    out = render(fx.Dashboard(), capsys, ["a", "b", "c"])
+    assert out.startswith(NO_WRAP + CLEAR) and out.endswith(WRAP)
+    assert all(f"\x1b[{row};1H{line}\x1b[K" in out for row, line in enumerate("abc", 1))
+
+
+def test_only_changed_rows_are_repainted(capsys):
+    dashboard = fx.Dashboard()
+    render(dashboard, capsys, ["a", "b", "c"])
+    out = render(dashboard, capsys, ["a", "B", "c"])
+    assert out == NO_WRAP + "\x1b[2;1HB\x1b[K" + "\x1b[4;1H" + WRAP
+    assert render(dashboard, capsys, ["a", "B", "c"]) == ""
+
+
+def test_shrinking_frame_clears_the_rows_below(capsys):
+    dashboard = fx.Dashboard()
+    render(dashboard, capsys, ["a", "b", "c"])
+    assert render(dashboard, capsys, ["a"]) == NO_WRAP + "\x1b[2;1H\x1b[J" + "\x1b[2;1H" + WRAP
+
+
+
+def test_prices_use_the_instrument_precision():
+    trader = fx.LiveOandaTrader('EUR_USD,USD_JPY', headless=True)
+    for inst, price in (('EUR_USD', 1.10012), ('USD_JPY', 151.234)):
+        trader.state['instruments'][inst].update(price=price, bid=price, ask=price + 2 * fx.pip_size(inst))
+    text = "\n".join(trader.dashboard.build_lines(trader.snapshot()))
+    assert "1.10012" in text and "151.234" in text
+    trader._open_trade('EUR_USD', {"order_type": 'BUY', "sl": 1.09, "tp": 1.11})
+    (position_id,) = trader.books['EUR_USD'].positions
+    trader._close_trade('EUR_USD', position_id, 1.10987, "TP")
+    assert any("@ 1.10032" in line for line in trader.logs) and any("HIT AT 1.10987" in line for line in trader.logs)
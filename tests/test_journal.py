@@ -0,0 +1,86 @@
+import json
+
+import fx
+
+T0 = 1_700_006_400  # Multiple of 4h
+
+
+def journal_in(tmp_path):
+    return fx.StateJournal(str(tmp_path), flush_interval=0.01)
+
+
+def test_recover_returns_the_snapshot_and_the_records_after_it(tmp_path):
+    journal = journal_in(tmp_path)
+    journal.start()
+    for n in range(3): journal.record('candle', inst='EUR_USD', n=n)
+    journal.snapshot({'instruments': {}})
+    for n in range(3, 5): journal.record('candle', inst='EUR_USD', n=n)
+    journal.close()
+    snapshot, records = journal_in(tmp_path).recover()
+    assert snapshot == {'instruments': {}, 'seq': 3}
+    assert records == [(4, 'candle', {'inst': 'EUR_USD', 'n': 3}), (5, 'candle', {'inst': 'EUR_USD', 'n': 4})]
+
+
+def test_a_torn_final_line_is_ignored(tmp_path):
+    journal = journal_in(tmp_path)
+    journal.start()
+    for n in range(3): journal.record('candle', inst='EUR_USD', n=n)
+    journal.close()
+    with open(journal.journal_path, 'a') as f: f.write('[4,"candle",{"inst":"EUR')
+    recovered = journal_in(tmp_path)
+    _, records = recovered.recover()
+    assert [seq for seq, _, _ in records] == [1, 2, 3] and recovered.seq == 3
+
+
+def trader_with_journal(tmp_path):
+    trader = fx.LiveOandaTrader('EUR_USD', headless=True, partial_take_profits=((0.5, 0.5),), max_positions=3)
+    trader.enable_journal(journal_in(tmp_path))
+    return trader
+
+
+def tick(trader, ts, mid):
+    trader._process_price('EUR_USD', mid - 0.00005, mid + 0.00005, ts)
+
+
+def test_recovery_replays_opens_partial_closes_and_pois_into_a_fresh_trader(tmp_path):
+    trader = trader_with_journal(tmp_path)
+    tick(trader, T0 + 10, 1.1000)  # First tick writes the snapshot; everything after it is replayed from the journal
+    trader._next_snapshot_at = float('inf')
+    for order_type, sl, tp in (('BUY', 1.0950, 1.1100), ('SELL', 1.1050, 1.0900), ('BUY', 1.0990, 1.1200)):
+        trader._open_trade('EUR_USD', {"order_type": order_type, "sl": sl, "tp": tp})
+    tick(trader, T0 + 20, 1.1052)  # SELL stops out, first BUY banks its partial TP
+    tick(trader, T0 + 30, 1.0985)  # Third position stops out
+    bot = trader.smc_bots['EUR_USD']
+    before = (frozenset(bot.mitigated_h1_pois), frozenset(bot.mitigated_h4_pois))
+    bot.mitigated_h1_pois.add(T0 - 3600); bot.mitigated_h4_pois.add(T0 - 14400)
+    trader._journal_pois('EUR_USD', before)
+    tick(trader, T0 + 3605, 1.1000)  # Closes the T0 H1 candle
+    trader.journal.close()
+    (position,) = trader.books['EUR_USD'].positions.values()
+    assert position['tp_levels'][0][1] == 0 and position['units'] == position['tp_levels'][1][1]  # Partial TP filled
+
+    fresh = trader_with_journal(tmp_path)
+    fresh.journal.close()
+    book = fresh.books['EUR_USD']
+    assert {pid: (p['units'], p['tp_levels']) for pid, p in book.positions.items()} == {position['id']: (position['units'], position['tp_levels'])}
+    assert book.unrealized(1.1, 1.1001) == trader.books['EUR_USD'].unrealized(1.1, 1.1001)
+    assert book._next_id == trader.books['EUR_USD']._next_id
+    assert fresh.smc_bots['EUR_USD'].mitigated_h1_pois == {T0 - 3600} and fresh.smc_bots['EUR_USD'].mitigated_h4_pois == {T0 - 14400}
+    assert fresh.h1_candles['EUR_USD'] == trader.h1_candles['EUR_USD'] and [c['time'] for c in fresh.h1_candles['EUR_USD']] == [T0]
+    assert fresh.state['instruments']['EUR_USD']['h1_candles_count'] == 1
+
+
+def test_stale_in_progress_candle_from_the_snapshot_is_discarded(tmp_path):
+    trader = trader_with_journal(tmp_path)
+    tick(trader, T0 + 10, 1.1000)
+    trader._next_snapshot_at = float('inf')
+    tick(trader, T0 + 3605, 1.1010)
+    trader.journal.close()
+    with open(trader.journal.snapshot_path) as f:
+        assert json.load(f)['instruments']['EUR_USD']['current_candles']['H1']['time'] == T0
+    fresh = trader_with_journal(tmp_path)
+    fresh.journal.close()
+    assert fresh.aggregators['EUR_USD'].current('H1') is None
+    assert fresh.aggregators['EUR_USD'].current('H4')['time'] == T0  # Still in progress, so kept
+    tick(fresh, T0 + 3700, 1.1020)
+    assert [c['time'] for c in fresh.h1_candles['EUR_USD']] == [T0]
@@ -0,0 +1,142 @@
+import time
+from collections import deque
+
+import pytest
+
+import fx
+
+QUOTES = {'XAU_USD': (2000.0, 2000.5), 'EUR_USD': (1.1, 1.1002)}
+
+
+@pytest.fixture
+def broker():
+    broker = fx.MockBroker(prices={inst: bid for inst, (bid, _) in QUOTES.items()}, seed=1)
+    broker.url = broker.start()
+    yield broker
+    broker.stop()
+
+
+def trader_for(broker, **options):
+    trader = fx.LiveOandaTrader(','.join(QUOTES), headless=True)
+    for inst, (bid, ask) in QUOTES.items(): trader.state['instruments'][inst].update(bid=bid, ask=ask, price=(bid + ask) / 2)
+    trader.enable_gateway(fx.OrderGateway(broker.url, {'Authorization': 'Bearer test'}, keepalive=0.5, **options))
+    return trader
+
+
+def open_positions(trader, count):
+    for n in range(count):
+        inst = list(QUOTES)[n % len(QUOTES)]
+        bid, ask = QUOTES[inst]
+        trader._open_trade(inst, {"order_type": 'BUY', "sl": bid * 0.99, "tp": ask * 1.01} if n % 2 else
+                                 {"order_type": 'SELL', "sl": ask * 1.01, "tp": bid * 0.99})
+
+
+def settle(trader, until, deadline=60.0):
+    end = time.monotonic() + deadline
+    while not until():
+        assert time.monotonic() < end, trader.gateway.report()
+        trader._apply_order_results()
+        time.sleep(0.01)
+    trader._apply_order_results()
+
+
+def local_trades(trader):
+    return {p['client_id'] for book in trader.books.values() for p in book.positions.values()}
+
+
+def broker_trades(broker, state='OPEN'):
+    return {trade_id for trade_id, trade in broker.trades.items() if trade['state'] == state}
+
+
+def test_timed_out_opens_are_kept_and_reconciled(broker):
+    broker.latency = 0.3
+    trader = trader_for(broker, timeout=0.2, retries=1, resubmits=20)
+    try:
+        open_positions(trader, 4)
+        settle(trader, lambda: trader.gateway.counts['failed'] >= 4)
+        assert len(local_trades(trader)) == 4
+        broker.latency = 0.0
+        settle(trader, lambda: trader.gateway.counts['filled'] == 4)
+        assert local_trades(trader) == broker_trades(broker) and len(broker.trades) == 4
+        assert trader.gateway.counts['rejected'] == 0
+    finally:
+        trader.gateway.stop()
+
+
+def test_books_match_the_broker_through_errors_and_lost_acks(broker):
+    broker.error_rate, broker.lost_ack_rate = 0.15, 0.15
+    trader = trader_for(broker, timeout=1.0, retries=3)
+    counts = trader.gateway.counts
+    done = lambda: counts['filled'] + counts['closed'] + counts['rejected'] == counts['submitted']
+    try:
+        open_positions(trader, 40)
+        settle(trader, done)
+        # An open whose every attempt got a 503 never reached the broker, so reconciling drops it rather than resending
+        assert all('NOT_AT_BROKER' in line for line in trader.logs if '❌' in line)
+        assert local_trades(trader) == broker_trades(broker) and len(broker.trades) == 40 - counts['rejected']
+        closing = [(inst, position_id) for inst, book in trader.books.items() for position_id in list(book.positions)[::2]]
+        for inst, position_id in closing: trader._close_trade(inst, position_id, QUOTES[inst][0], "TEST")
+        settle(trader, done)
+        assert local_trades(trader) == broker_trades(broker)
+        assert len(broker_trades(broker, 'CLOSED')) == len(closing)
+    finally:
+        trader.gateway.stop()
+
+
+def test_unreachable_broker_gives_up_after_the_resubmit_limit(broker):
+    broker.stop()  # Before the gateway connects: shutdown() leaves established keep-alive connections served
+    trader = trader_for(broker, timeout=0.2, retries=1, resubmits=3)
+    counts = trader.gateway.counts
+    try:
+        open_positions(trader, 1)
+        (position,) = trader.books['XAU_USD'].positions.values()
+        settle(trader, lambda: any('still unconfirmed' in line for line in trader.logs), deadline=30.0)
+        time.sleep(0.5); trader._apply_order_results()
+        assert counts['submitted'] == 1 and counts['failed'] == 1
+        assert sum('unconfirmed' in line for line in trader.logs) == 2
+        assert trader.books['XAU_USD'].positions == {position['id']: position} and position['unconfirmed']
+        assert all(inbox.empty() for inbox in trader.gateway.inboxes)
+    finally:
+        trader.gateway.stop()
+
+
+def test_reconcile_never_resends_an_open(broker):
+    trader = trader_for(broker)
+    try:
+        open_positions(trader, 1)
+        settle(trader, lambda: trader.gateway.counts['filled'] == 1)
+        (position,) = trader.books['XAU_USD'].positions.values()
+        order = trader.gateway.submit_open('XAU_USD', dict(position, id=position['id'] + 100))
+        settle(trader, lambda: trader.gateway.counts['filled'] == 2)
+        del broker.trades[order['trade_client_id']]
+        order.update(status='FAILED', error='ReadTimeout')
+        trader.books['XAU_USD'].add(dict(position, id=order['position_id'], client_id=order['trade_client_id']))
+        trader.gateway.completed.append(order)
+        settle(trader, lambda: trader.gateway.counts['rejected'] == 1)
+        assert order['error'] == 'NOT_AT_BROKER' and order['trade_client_id'] not in broker.trades
+        assert list(trader.books['XAU_USD'].positions) == [position['id']]
+    finally:
+        trader.gateway.stop()
+
+
+class GatewayStub:
+    def __init__(self, *orders):
+        self.completed, self.resubmitted = deque(orders), []
+
+    def resubmit(self, order):
+        order['resubmits'] = order.get('resubmits', 0) + 1
+        self.resubmitted.append(order)
+        return True
+
+
+def test_only_rejected_opens_are_dropped():
+    trader = fx.LiveOandaTrader(','.join(QUOTES), headless=True)
+    for inst, (bid, ask) in QUOTES.items(): trader.state['instruments'][inst].update(bid=bid, ask=ask, price=(bid + ask) / 2)
+    open_positions(trader, 2)
+    (rejected,), (failed,) = trader.books['XAU_USD'].positions, trader.books['EUR_USD'].positions
+    order = lambda inst, position_id, status: {"inst": inst, "kind": 'open', "position_id": position_id, "status": status,
+                                               "error": 'ReadTimeout', "decided": 0, "acked": 1, "attempts": 4}
+    trader.gateway = GatewayStub(order('XAU_USD', rejected, 'REJECTED'), order('EUR_USD', failed, 'FAILED'))
+    trader._apply_order_results()
+    assert not trader.books['XAU_USD'].positions and list(trader.books['EUR_USD'].positions) == [failed]
+    assert [o['position_id'] for o in trader.gateway.resubmitted] == [failed]
@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+import fx
+
+
+def position(order_type, entry, sl, tp, units=100, tp_levels=None):
+    trade = {"order_type": order_type, "entry_price_with_spread": entry, "sl": sl, "tp": tp, "units": units}
+    if tp_levels: trade['tp_levels'] = tp_levels
+    return trade
+
+
+def heap_entries(book):
+    return len(book._long_sl) + len(book._long_tp) + len(book._short_sl) + len(book._short_tp)
+
+
+def drain(book, bid, ask):
+    """What a trader does with one quote: close everything triggered() returns."""
+    hits = book.triggered(bid, ask)
+    for pid, price, _, units, level in hits: book.close(pid, units, price, level)
+    return hits
+
+
+@pytest.mark.parametrize("order_type, bid, ask, reason, price", [
+    ('BUY', 98.9, 99.0, "STOP LOSS", 98.9), ('BUY', 102.0, 102.1, "TAKE PROFIT", 102.0),
+    ('SELL', 100.9, 101.0, "STOP LOSS", 101.0), ('SELL', 97.9, 98.0, "TAKE PROFIT", 98.0)])
+def test_longs_trigger_on_the_bid_and_shorts_on_the_ask(order_type, bid, ask, reason, price):
+    book = fx.PositionBook()
+    if order_type == 'BUY': pid = book.add(position('BUY', 100.0, 99.0, 102.0))['id']
+    else: pid = book.add(position('SELL', 100.0, 101.0, 98.0))['id']
+    assert book.triggered(99.5, 99.6) == [] and book.triggered(100.4, 100.5) == []
+    assert drain(book, bid, ask) == [(pid, price, reason, 100, None if reason == "STOP LOSS" else 0)]
+    assert not book.positions and book.unrealized(bid, ask) == 0.0
+
+
+def test_partial_take_profit_then_stop_loss_on_the_rest():
+    book = fx.PositionBook()
+    pid = book.add(position('BUY', 100.0, 99.0, 102.0, units=100, tp_levels=[[101.0, 40], [102.0, 60]]))['id']
+    assert drain(book, 101.0, 101.1) == [(pid, 101.0, "PARTIAL TP", 40, 0)]
+    assert book.positions[pid]['units'] == 60 and book.realized_pnl == pytest.approx(40.0)
+    assert drain(book, 101.05, 101.15) == []  # The filled level doesn't fire again
+    assert drain(book, 98.5, 98.6) == [(pid, 98.5, "STOP LOSS", 60, None)]
+    assert not book.positions and book.realized_pnl == pytest.approx(40.0 - 90.0)
+
+
+def test_unrealized_matches_the_sum_over_positions():
+    rng, book = random.Random(3), fx.PositionBook()
+    for _ in range(200):
+        entry = rng.uniform(90, 110)
+        if rng.random() < 0.5: book.add(position('BUY', entry, entry - 50, entry + 50, units=rng.randint(1, 1000)))
+        else: book.add(position('SELL', entry, entry + 50, entry - 50, units=rng.randint(1, 1000)))
+    for pid in rng.sample(sorted(book.positions), 80): book.close(pid, rng.randint(1, 1000), 100.0)
+    for bid in (95.0, 100.0, 105.0):
+        expected = sum(fx.PositionBook.pnl(p, bid, bid + 0.1) for p in book.positions.values())
+        assert book.unrealized(bid, bid + 0.1) == pytest.approx(expected, rel=1e-9, abs=1e-6)
+
+
+def test_heaps_are_rebuilt_once_stale_entries_dominate():
+    book = fx.PositionBook()
+    pids = [book.add(position('BUY', 100.0, 90.0 - n * 0.01, 110.0 + n * 0.01))['id'] for n in range(100)]
+    for pid in pids[:83]: book.close(pid, 100, 100.0)
+    assert len(book.positions) == 17 and heap_entries(book) == 200  # 200 <= 8 * 17 + 64: stale entries kept
+    book.close(pids[83], 100, 100.0)
+    assert heap_entries(book) == 2 * 16
+    assert drain(book, 89.0, 89.1) == [(pid, 89.0, "STOP LOSS", 100, None) for pid in pids[84:]]
+
+
+def test_triggered_matches_a_naive_scan():
+    rng, book, naive = random.Random(7), fx.PositionBook(), {}
+    price = 100.0
+    for step in range(3000):
+        if rng.random() < 0.05:
+            side, distance = rng.choice(('BUY', 'SELL')), rng.uniform(0.2, 3.0)
+            sl, tp = (price - distance, price + distance) if side == 'BUY' else (price + distance, price - distance)
+            trade = book.add(position(side, price, sl, tp))
+            naive[trade['id']] = (side, sl, tp)
+        price += rng.gauss(0, 0.1)
+        bid, ask = price, price + 0.02
+        expected = set()
+        for pid, (side, sl, tp) in naive.items():
+            if side == 'BUY' and (bid <= sl or bid >= tp): expected.add(pid)
+            if side == 'SELL' and (ask >= sl or ask <= tp): expected.add(pid)
+        assert {pid for pid, *_ in drain(book, bid, ask)} == expected
+        for pid in expected: del naive[pid]
+        assert set(book.positions) == set(naive)
@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+import fx
+
+
+def open_and_replay(trader, ticks, split):
+    """Replays `ticks`, opening a BUY with a tight SL/TP at tick `split`."""
+    trader.run(ticks[:split])
+    price = trader.state['instruments']['XAU_USD']['price']
+    trader._open_trade('XAU_USD', {'order_type': 'BUY', 'sl': price * 0.999, 'tp': price * 1.001})
+    return trader.run(ticks[split:])
+
+
+@pytest.mark.parametrize('as_messages', (False, True))
+def test_ledger_times_are_epoch_seconds(as_messages):
+    ticks = fx._bench_price_messages(['XAU_USD'], 4000, 0) if as_messages else list(fx.synthetic_ticks('XAU_USD', 1_600_000_000.0, 4000))
+    trader = fx.ReplayTrader('XAU_USD', headless=True)
+    open_and_replay(trader, ticks, 1000)
+    assert trader.ledger
+    for row in trader.ledger:
+        assert isinstance(row['entry_time'], float) and isinstance(row['exit_time'], float)
+        assert 1_600_000_000.0 <= row['entry_time'] <= row['exit_time'] < 1_600_100_000.0
+
+
+def test_summary_is_strict_json():
+    trader = fx.ReplayTrader('XAU_USD', headless=True)
+    trader.ledger = [{'pnl_usd': 5.0}, {'pnl_usd': 2.5}]
+    summary = trader.summary()
+    assert summary['profit_factor'] is None
+    json.dumps(summary, allow_nan=False)
+    trader.ledger.append({'pnl_usd': -2.5})
+    assert trader.summary()['profit_factor'] == 3.0
@@ -0,0 +1,55 @@
+import queue
+import time
+from collections import deque
+
+import fx
+
+
+def sharded_trader(instruments):
+    trader = fx.ShardedOandaTrader(instruments, workers=1, headless=True)
+    trader.monitor = fx.LatencyMonitor(trader.instrument_list, sample_every=1)
+    return trader
+
+
+def test_ingest_counts_ticks_and_samples_lag():
+    trader = sharded_trader('XAU_USD,EUR_USD')
+    try:
+        now = time.time()
+        trader._process_price('XAU_USD', 2000.0, 2000.5, now - 0.5)
+        trader._process_burst('EUR_USD', [(1.1, 1.1002, now - 0.2), (1.1001, 1.1003, now - 0.1)])
+        assert trader.monitor.ticks == {'XAU_USD': 1, 'EUR_USD': 2}
+        lag = trader.monitor.report()['tick_lag_ms']
+        assert lag['XAU_USD']['count'] == 1 and lag['XAU_USD']['p50'] >= 400
+        assert lag['EUR_USD']['count'] == 1 and lag['EUR_USD']['p50'] < 400
+        assert trader.monitor.stages['process_price'].total == 2
+    finally:
+        trader.board.close()
+
+
+def test_rejected_open_in_a_shard_closes_the_dashboard_position():
+    ingest = sharded_trader('XAU_USD')
+    events = queue.Queue()
+    board = fx.PriceBoard(ingest.instrument_list, ingest.board.name)
+    worker = fx.ShardTrader(['XAU_USD'], events, board)
+    try:
+        worker.state['instruments']['XAU_USD'].update(bid=2000.0, ask=2000.5)
+        worker._open_trade('XAU_USD', {"order_type": 'BUY', "sl": 1990.0, "tp": 2020.0})
+        (position_id,) = worker.books['XAU_USD'].positions
+        worker.gateway = type('Gateway', (), {'completed': deque([{
+            "inst": 'XAU_USD', "kind": 'open', "position_id": position_id, "status": 'REJECTED', "error": 'MARKET_HALTED',
+            "decided": 0, "acked": 1_000_000, "attempts": 1}])})()
+        worker._apply_order_results()
+        assert not worker.books['XAU_USD'].positions
+        events.put(None)
+        ingest.events = events
+        ingest._apply_events()
+        assert not ingest.books['XAU_USD'].positions
+    finally:
+        board.close()
+        ingest.board.close()
+
+
+def test_missing_usd_cross_is_logged():
+    trader = fx.LiveOandaTrader('EUR_GBP', headless=True)
+    assert trader._calculate_units('EUR_GBP', 20.0) == 0
+    assert any('GBP_USD' in line for line in trader.logs)
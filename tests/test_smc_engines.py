@@ -0,0 +1,51 @@
+import json
+import os
+import random
+
+import pytest
+
+import fx
+
+ENGINES = (fx.SMCBot, fx.ColumnarSMCBot, fx.IncrementalSMCBot)
+PARAMS = ({}, {'min_candles': 7, 'default_tp_pct': 0.01, 'strong_body_ratio': 1.3})
+
+
+def random_series(rng: random.Random, count: int, step: int):
+    """Candles in the Input.json shape, rounded to one decimal so highs and lows often tie."""
+    candles, price = [], 100.0
+    for i in range(count):
+        open_ = price
+        close = open_ + rng.gauss(0, 1) * (6 if rng.random() < 0.2 else 1)
+        if rng.random() < 0.1: close = open_
+        high = max(open_, close) + abs(rng.gauss(0, 0.5))
+        low = min(open_, close) - abs(rng.gauss(0, 0.5)) * (8 if rng.random() < 0.2 else 1)
+        candles.append({"time": i * step, "open": round(open_, 1), "high": round(high, 1), "low": round(low, 1), "close": round(close, 1)})
+        price = close
+    return candles
+
+
+def assert_engines_agree(h4, h1, params):
+    """Feeds growing prefixes of the history, as the live loop does, and compares every engine after each H1 candle."""
+    bots = [engine('TEST', **params) for engine in ENGINES]
+    for k in range(1, len(h1) + 1):
+        h4_prefix, h1_prefix = h4[:min(len(h4), k // 4 + 3)], h1[:k]
+        expected, *others = [bot.analyze(h4_prefix, h1_prefix) for bot in bots]
+        for bot, result in zip(bots[1:], others):
+            assert result == expected, (type(bot).__name__, k)
+            assert bot.mitigated_h1_pois == bots[0].mitigated_h1_pois, (type(bot).__name__, k)
+            assert bot.mitigated_h4_pois == bots[0].mitigated_h4_pois, (type(bot).__name__, k)
+
+
+@pytest.mark.parametrize('params', PARAMS)
+def test_input_json(params):
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Input.json')) as f: data = json.load(f)
+    assert_engines_agree(data['h4_data'], data['h1_data'], params)
+
+
+@pytest.mark.parametrize('params', PARAMS)
+@pytest.mark.parametrize('seed', range(30))
+def test_random_series(seed, params):
+    rng = random.Random(seed)
+    h4 = random_series(rng, rng.randint(3, 80), 14400)
+    h1 = random_series(rng, rng.randint(3, 200), 3600)
+    assert_engines_agree(h4, h1, params)
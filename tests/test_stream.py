@@ -0,0 +1,124 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import fx
+
+INSTRUMENTS = ('XAU_USD', 'EUR_USD')
+
+
+def price_message(inst, ts, bid, ask):
+    """A PRICE message with OANDA's key order and nanosecond timestamps."""
+    stamp = datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f') + '123Z'
+    return {"type": "PRICE", "time": stamp, "bids": [{"price": f"{bid:.5f}", "liquidity": 1000000}],
+            "asks": [{"price": f"{ask:.5f}", "liquidity": 1000000}], "closeoutBid": f"{bid:.5f}", "closeoutAsk": f"{ask:.5f}",
+            "status": "tradeable", "tradeable": True, "instrument": inst}
+
+
+def canned_lines(count):
+    sources = [fx.synthetic_ticks(inst, 1_700_000_000.0, count // 2, price=price, interval=2.0, seed=i)
+               for i, (inst, price) in enumerate(zip(INSTRUMENTS, (2000.0, 1.1)))]
+    lines = []
+    for i, tick in enumerate(sorted((t for source in sources for t in source), key=lambda t: t[1])):
+        lines.append(json.dumps(price_message(*tick), separators=(',', ':')).encode())
+        if i % 25 == 0: lines.append(b'{"type":"HEARTBEAT","time":"%s"}' % json.loads(lines[-1])['time'].encode())
+    return lines
+
+
+class StreamServer:
+    """Streams `parts` (one list of lines per connection, then the last one again) as chunked
+    HTTP/1.1, with chunk boundaries inside lines and the bytes written in random-sized pieces."""
+    def __init__(self, parts):
+        self.parts, self.connections = parts, 0
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            def do_GET(self):
+                part = server.parts[min(server.connections, len(server.parts) - 1)]
+                server.connections += 1
+                self.send_response(200); self.send_header('Transfer-Encoding', 'chunked'); self.end_headers()
+                body, rng = b"".join(line + b"\n" for line in part), random.Random(server.connections)
+                framed, pos = [], 0
+                while pos < len(body):
+                    size = rng.randint(1, 700)
+                    framed.append(b"%x\r\n%s\r\n" % (len(body[pos:pos + size]), body[pos:pos + size])); pos += size
+                raw, pos = b"".join(framed) + b"0\r\n\r\n", 0
+                while pos < len(raw):
+                    size = rng.randint(1, 4000)
+                    self.wfile.write(raw[pos:pos + size]); self.wfile.flush(); pos += size
+                    if rng.random() < 0.05: time.sleep(0.001)  # Lets a read end mid-chunk or mid-line
+                self.close_connection = True
+            def log_message(self, *args): pass
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v3/accounts/test/pricing/stream"
+
+    def close(self):
+        self.server.shutdown(); self.server.server_close()
+
+
+@pytest.fixture
+def lines():
+    return canned_lines(20000)
+
+
+def test_decode_price_line():
+    message = price_message('EUR_USD', 1_700_000_000.0, 1.10001, 1.10012)
+    assert fx.decode_price_line(json.dumps(message, separators=(',', ':')).encode()) == ('EUR_USD', message['time'], 1.10001, 1.10012)
+    assert fx.decode_price_line(json.dumps(message).encode()) == ('EUR_USD', message['time'], 1.10001, 1.10012)  # json.loads fallback
+    assert fx.decode_price_line(b'{"type":"HEARTBEAT","time":"2024-01-01T00:00:00.000000000Z"}') is None
+    assert fx.decode_price_line(b'{"type":"PRICE","instrument":"EUR_USD"') is None
+
+
+def test_batches_reassemble_split_chunks(lines):
+    server = StreamServer([lines])
+    async def collect():
+        received = []
+        async for batch in fx.AsyncPriceStream(server.url, {}, {'instruments': ','.join(INSTRUMENTS)}).batches(): received.extend(batch)
+        return received
+    try: received = asyncio.run(collect())
+    finally: server.close()
+    assert [line for line in received if line] == lines
+
+
+def test_stream_async_reconnects_and_matches_replay(lines):
+    half = len(lines) // 2
+    server = StreamServer([lines[:half], lines[half:], []])
+    trader = fx.LiveOandaTrader(','.join(INSTRUMENTS), headless=True)
+    trader.url = server.url
+    expected = sum(1 for line in lines if b'"PRICE"' in line)
+    async def run():
+        task = asyncio.create_task(trader.stream_async(max_backoff=0.05))
+        deadline = time.monotonic() + 30
+        while trader.ticks_processed < expected and time.monotonic() < deadline: await asyncio.sleep(0.01)
+        task.cancel()
+    try: asyncio.run(run())
+    finally: server.close()
+    assert trader.ticks_processed == expected and server.connections >= 2
+    replay = fx.ReplayTrader(','.join(INSTRUMENTS), headless=True)
+    replay.run(json.loads(line) for line in lines)
+    for tf in trader.timeframes:
+        assert trader.candles[tf] == replay.candles[tf]
+        for inst in INSTRUMENTS: assert trader.aggregators[inst].current(tf) == replay.aggregators[inst].current(tf)
+
+
+def test_both_clients_consume_a_mock_broker_stream_and_return(lines):
+    broker = fx.MockBroker(stream_lines=lines)
+    url = broker.start() + "/v3/accounts/test/pricing/stream"
+    replay = fx.ReplayTrader(','.join(INSTRUMENTS), headless=True)
+    replay.run(json.loads(line) for line in lines)
+    try:
+        for run in (lambda trader: trader.stream(reconnect=False), lambda trader: asyncio.run(trader.stream_async(reconnect=False))):
+            trader = fx.LiveOandaTrader(','.join(INSTRUMENTS), headless=True)
+            trader.url = url
+            run(trader)
+            for tf in trader.timeframes: assert trader.candles[tf] == replay.candles[tf]
+    finally:
+        broker.stop()
@@ -0,0 +1,42 @@
+from multiprocessing import shared_memory
+
+import pytest
+
+import fx
+
+GRID = {'default_tp_pct': [0.003, 0.01], 'min_candles': [5, 10]}
+
+
+@pytest.fixture
+def created_segments(monkeypatch):
+    names = []
+    class Recording(shared_memory.SharedMemory):
+        def __init__(self, name=None, create=False, size=0):
+            super().__init__(name=name, create=create, size=size)
+            if create: names.append(self.name)
+    monkeypatch.setattr(fx.shared_memory, 'SharedMemory', Recording)
+    return names
+
+
+def test_run_sweep_covers_the_grid_and_ranks_best_first(created_segments):
+    arrays = fx.ticks_to_arrays(tick for seed, (inst, price) in enumerate((('XAU_USD', 2000.0), ('EUR_USD', 1.1)))
+                                for tick in fx.synthetic_ticks(inst, 1_600_000_000.0, 20_000, price=price, seed=seed))
+    # Synthetic walks rarely produce an SMC setup, so rank by the tick count, which differs between equal-length ranges
+    results = fx.run_sweep(arrays, GRID, splits=2, workers=2, rank_by='ticks')
+    assert len(results) == len(fx.expand_grid(GRID)) * len(arrays) * 2
+    ticks = [r['ticks'] for r in results]
+    assert ticks == sorted(ticks, reverse=True) and len(set(ticks)) > 1
+    for inst, arr in arrays.items():
+        for params in fx.expand_grid(GRID):
+            runs = [r for r in results if r['instrument'] == inst and r['params'] == params]
+            assert len(runs) == 2 and sum(r['ticks'] for r in runs) == len(arr)
+    assert len(created_segments) == len(arrays)
+    for name in created_segments:
+        with pytest.raises(FileNotFoundError): shared_memory.SharedMemory(name=name)
+
+
+def test_split_ranges_are_contiguous_and_cover_every_tick():
+    arr = fx.ticks_to_arrays(fx.synthetic_ticks('EUR_USD', 1_600_000_000.0, 1000, seed=1))['EUR_USD']
+    ranges = fx.split_ranges(arr, 3)
+    assert ranges[0][0] == arr['time'][0] and ranges[-1][1] > arr['time'][-1]
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
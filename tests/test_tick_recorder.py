@@ -0,0 +1,98 @@
+import asyncio
+import json
+import os
+import random
+import time
+
+import numpy as np
+
+import fx
+from test_stream import INSTRUMENTS, StreamServer, canned_lines
+
+
+def record_stream(directory, lines):
+    """Runs stream_async over `lines` with a TickRecorder attached, as `--record-ticks --stream-client asyncio` does."""
+    server = StreamServer([lines, []])
+    trader = fx.LiveOandaTrader(','.join(INSTRUMENTS), headless=True)
+    trader.url, trader.recorder = server.url, fx.TickRecorder(directory, file_records=5000)
+    expected = sum(1 for line in lines if b'"PRICE"' in line)
+    async def run():
+        task = asyncio.create_task(trader.stream_async())
+        while trader.ticks_processed < expected: await asyncio.sleep(0.01)
+        task.cancel()
+    try: asyncio.run(run())
+    finally: server.close(); trader.recorder.close()
+    return expected
+
+
+def test_streamed_ticks_are_recorded_in_time_order(tmp_path):
+    lines = canned_lines(12000)
+    count = record_stream(str(tmp_path), lines)
+    reader = fx.TickReader(str(tmp_path))
+    records = np.concatenate(list(reader.read()))
+    assert len(records) == count and len(reader._files()) > 1
+    assert (np.diff(records['ts_ns']) >= 0).all()
+    messages = [json.loads(line) for line in lines if b'"PRICE"' in line]
+    assert sorted((m['instrument'], float(m['bids'][0]['price'])) for m in messages) == \
+        sorted((reader.instrument_names[int(r['inst'])], float(r['bid'])) for r in records)
+    rng, ts = random.Random(0), records['ts_ns']
+    for _ in range(200):
+        start, end = sorted(rng.randint(int(ts[0]) - 10**9, int(ts[-1]) + 10**9) for _ in range(2))
+        assert sum(len(view) for view in reader.read(start, end)) == int(((ts >= start) & (ts < end)).sum())
+
+
+def test_quiet_market_is_flushed_on_a_timer(tmp_path):
+    recorder = fx.TickRecorder(str(tmp_path), flush_interval=0.05)
+    try:
+        for i in range(10): recorder.record('EUR_USD', 1_700_000_000_000_000_000 + i, 1.1, 1.1001)
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            if sum(len(view) for view in fx.TickReader(str(tmp_path)).read()) == 10: break
+            time.sleep(0.01)
+        assert sum(len(view) for view in fx.TickReader(str(tmp_path)).read()) == 10
+    finally: recorder.close()
+
+
+def test_out_of_order_batch_is_sorted(tmp_path):
+    recorder = fx.TickRecorder(str(tmp_path), flush_interval=60)
+    stamps = [5, 3, 4, 1, 2]
+    for i, ts in enumerate(stamps): recorder.record(INSTRUMENTS[i % 2], ts, float(i), float(i))
+    recorder.close()
+    records = np.concatenate(list(fx.TickReader(str(tmp_path)).read()))
+    assert records['ts_ns'].tolist() == sorted(stamps)
+    assert len(os.listdir(tmp_path)) == 3  # instruments.json, one .bin and its .idx
+
+
+def wait_for_records(directory, count):
+    deadline = time.monotonic() + 5
+    while sum(len(view) for view in fx.TickReader(directory).read()) < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_ticks_interleaving_across_flushes_stay_sorted(tmp_path):
+    recorder = fx.TickRecorder(str(tmp_path), flush_interval=0.02)
+    base, rng, stamps = 1_700_000_000_000_000_000, random.Random(1), []
+    try:
+        for i in range(3000):  # The second instrument's clock runs up to 200 ms behind the first
+            ts = base + i * 1_000_000 - (rng.randint(0, 200_000_000) if i % 2 else 0)
+            recorder.record(INSTRUMENTS[i % 2], ts, 1.0, 1.0); stamps.append(ts)
+            if i % 50 == 0: time.sleep(0.005)  # Several flushes mid-stream, none of them idle
+    finally: recorder.close()
+    reader = fx.TickReader(str(tmp_path))
+    ts = np.concatenate(list(reader.read()))['ts_ns']
+    assert ts.tolist() == sorted(stamps)
+    for _ in range(100):
+        start, end = sorted(rng.randint(base, base + 3000 * 1_000_000) for _ in range(2))
+        assert sum(len(view) for view in reader.read(start, end)) == int(((ts >= start) & (ts < end)).sum())
+
+
+def test_straggler_behind_written_ticks_is_clamped(tmp_path):
+    recorder = fx.TickRecorder(str(tmp_path), flush_interval=0.01)
+    try:
+        recorder.record('EUR_USD', 10_000_000_000, 1.1, 1.1001)
+        wait_for_records(str(tmp_path), 1)
+        recorder.record('XAU_USD', 5_000_000_000, 2000.0, 2000.5)
+    finally: recorder.close()
+    records = np.concatenate(list(fx.TickReader(str(tmp_path)).read()))
+    assert records['ts_ns'].tolist() == [10_000_000_000, 10_000_000_000] and records['bid'].tolist() == [1.1, 2000.0]
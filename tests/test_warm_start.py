@@ -0,0 +1,111 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import fx
+
+NOW = 1_700_006_400  # Multiple of 4h; the stub's clock starts here
+SECONDS = {'H1': 3600, 'H4': 14400}
+
+
+class CandleStub:
+    """Serves /v3/instruments/<inst>/candles like OANDA (UNIX times, `count`/`from`, one incomplete candle at the end)
+    and tracks requests, distinct client connections and peak concurrency."""
+    def __init__(self, history=1500):
+        self.now = NOW
+        self.history, self.requests, self.connections, self.active, self.peak = history, [], set(), 0, 0
+        self.lock = threading.Lock()
+        stub = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            def do_GET(self):
+                with stub.lock:
+                    stub.active += 1; stub.peak = max(stub.peak, stub.active)
+                    stub.connections.add(self.client_address); stub.requests.append(self.path)
+                try: body = json.dumps(stub.candles(self.path)).encode()
+                finally:
+                    with stub.lock: stub.active -= 1
+                self.send_response(200); self.send_header('Content-Type', 'application/json'); self.send_header('Content-Length', str(len(body)))
+                self.end_headers(); self.wfile.write(body)
+            def log_message(self, *args): pass
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def candles(self, path):
+        parts = urlsplit(path)
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        step = SECONDS[query['granularity']]
+        times = list(range(self.now - self.history * step, self.now + 1, step))  # Last one is still forming
+        if 'from' in query: times = [t for t in times if t >= int(query['from'])][:int(query['count'])]
+        else: times = times[-int(query['count']):]
+        mid = lambda t: {"o": f"{t % 97 + 100:.1f}", "h": f"{t % 97 + 101:.1f}", "l": f"{t % 97 + 99:.1f}", "c": f"{t % 89 + 100:.1f}"}
+        return {"instrument": parts.path.split('/')[3], "granularity": query['granularity'],
+                "candles": [{"complete": t < self.now, "time": f"{t}.000000000", "volume": 1, "mid": mid(t)} for t in times]}
+
+    def close(self):
+        self.server.shutdown(); self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    stub = CandleStub()
+    yield stub
+    stub.close()
+
+
+def test_warm_start_caps_connections(stub, tmp_path, caplog):
+    instruments = fx.FX_METALS_UNIVERSE.split(',')[:40]
+    trader = fx.LiveOandaTrader(instruments, headless=True)
+    starter = fx.WarmStarter(stub.url, trader.headers, fx.CandleCache(str(tmp_path)), candles=500)
+    with caplog.at_level(logging.WARNING, logger='urllib3'): trader.warm_start(starter)
+    assert not [r for r in caplog.records if 'pool is full' in r.getMessage()]
+    assert len(stub.requests) == 2 * len(instruments)
+    assert stub.peak <= fx.WARM_START_WORKERS and len(stub.connections) <= fx.WARM_START_WORKERS
+    for inst in instruments:
+        for tf in ('H1', 'H4'):
+            candles = trader.candles[tf][inst]
+            assert len(candles) == 499 and candles[-1]['time'] == NOW - SECONDS[tf]  # `count` includes the forming candle
+            assert trader.state['instruments'][inst][f"{tf.lower()}_candles_count"] == 499
+
+
+def test_warm_start_tops_up_from_cache(stub, tmp_path):
+    cache = fx.CandleCache(str(tmp_path))
+    fx.LiveOandaTrader('EUR_USD', headless=True).warm_start(fx.WarmStarter(stub.url, {}, cache, candles=300))
+    stub.now, stub.requests = NOW + 3 * 14400, []
+    trader = fx.LiveOandaTrader('EUR_USD', headless=True)
+    trader.warm_start(fx.WarmStarter(stub.url, {}, cache, candles=300))
+    assert len(stub.requests) == 2 and all('from=' in path for path in stub.requests)
+    assert [c['time'] for c in trader.h1_candles['EUR_USD']] == list(range(stub.now - 300 * 3600, stub.now, 3600))
+    assert [c['time'] for c in trader.h4_candles['EUR_USD']] == list(range(stub.now - 300 * 14400, stub.now, 14400))
+
+
+def test_warm_start_without_instruments(stub, tmp_path):
+    fx.LiveOandaTrader([], headless=True).warm_start(fx.WarmStarter(stub.url, {}, fx.CandleCache(str(tmp_path))))
+    assert not stub.requests
+
+
+def test_warm_start_falls_back_to_cache_when_the_top_up_fails(stub, tmp_path):
+    cache = fx.CandleCache(str(tmp_path))
+    fx.LiveOandaTrader('EUR_USD', headless=True).warm_start(fx.WarmStarter(stub.url, {}, cache, candles=300))
+    url = stub.url
+    stub.close()
+    trader = fx.LiveOandaTrader('EUR_USD', headless=True)
+    trader.warm_start(fx.WarmStarter(url, {}, cache, candles=300, timeout=1.0))
+    assert len(trader.h1_candles['EUR_USD']) == len(trader.h4_candles['EUR_USD']) == 299  # `count` includes the forming candle
+    assert trader.h1_candles['EUR_USD'][-1]['time'] == NOW - 3600
+    assert sum('top-up skipped' in line for line in trader.logs) == 2
+    assert not any('Warm start failed' in line for line in trader.logs)
+
+
+def test_warm_start_without_cache_or_network_logs_the_failure(tmp_path):
+    stub = CandleStub()
+    stub.close()
+    trader = fx.LiveOandaTrader('EUR_USD', headless=True)
+    trader.warm_start(fx.WarmStarter(stub.url, {}, fx.CandleCache(str(tmp_path)), timeout=1.0))
+    assert not trader.h1_candles['EUR_USD'] and sum('Warm start failed' in line for line in trader.logs) == 2